@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+# 基于机器视觉的人脸表情识别系统设计-汪哲文毕业设计
+#
+# backend.py
+# 本文件为数据层，为表情识别模型提供可替换的推理后端
+# 各后端读取同一份 fer2013_mini_XCEPTION 权重，对外提供相同的接口
+#
+# EmotionBackend
+# 推理后端的抽象基类，约定 input_shape 属性和 predict 方法
+#
+# KerasBackend
+# 通过 Model.predict 推理，与原先的行为一致
+#
+# KerasCallBackend
+# 直接调用 Model.__call__ 推理，省去 predict 每次调用的准备开销
+#
+# OpenCVBackend
+# 通过 cv2.dnn 读取导出的 ONNX 模型推理，无需 TensorFlow
+#
+# ONNXBackend
+# 通过 ONNX Runtime 在 CPU 上推理导出的 ONNX 模型
+#
+# NumpyBackend
+# 通过 engine.py 中的 NumPy 推理引擎直接读取 HDF5 权重推理，无需 TensorFlow
+#
+# TFLiteBackend
+# 通过 TensorFlow Lite 在 CPU 上推理 models/quantize.py 生成的 float16 或 INT8 量化模型
+#
+# exportONNX
+# 将 Keras 模型一次性导出为 ONNX 文件
+#
+# modelPath
+# 推理后端实际读取的模型文件，识别结果的缓存以此判断模型是否改变
+#
+# loadBackend
+# 根据名称创建推理后端，ONNX 文件不存在时会先自动导出
+# 量化模型需要校准数据，不会自动生成，需先运行 models/quantize.py
+#
+# 最后更新时间 2026/10/18
+
+from abc import ABC, abstractmethod
+import os
+import sys
+
+import cv2
+import numpy as np
+
+# 表情识别模型的输入尺寸，与 models/train.py 中的 input_shape 一致
+INPUT_SHAPE = (None, 48, 48, 1)
+
+
+# 推理后端的抽象基类
+class EmotionBackend(ABC):
+    input_shape: tuple
+
+    # 输入 N*48*48*1 的 float32 张量，返回 N*7 的表情概率
+    @abstractmethod
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        pass
+
+
+# 通过 Model.predict 推理
+class KerasBackend(EmotionBackend):
+
+    def __init__(self, path: str) -> None:
+        from keras.models import load_model
+        self.model = load_model(path, compile=False)
+        self.input_shape = tuple(self.model.input_shape)
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        return self.model.predict(x, verbose=0)  # type: ignore
+
+
+# 直接调用 Model.__call__ 推理
+class KerasCallBackend(KerasBackend):
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        return self.model(x, training=False).numpy()  # type: ignore
+
+
+# 通过 cv2.dnn 推理导出的 ONNX 模型
+class OpenCVBackend(EmotionBackend):
+
+    def __init__(self, path: str) -> None:
+        self.net = cv2.dnn.readNetFromONNX(path)
+        self.input_shape = INPUT_SHAPE
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        self.net.setInput(np.ascontiguousarray(x, dtype=np.float32))
+        return self.net.forward()
+
+
+# 通过 ONNX Runtime 推理导出的 ONNX 模型
+class ONNXBackend(EmotionBackend):
+
+    def __init__(self, path: str) -> None:
+        import onnxruntime
+        self.session = onnxruntime.InferenceSession(
+            path, providers=['CPUExecutionProvider'])
+        inputs = self.session.get_inputs()[0]
+        self.input_name = inputs.name
+        self.input_shape = (None, *inputs.shape[1:])
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        return self.session.run(None, {self.input_name: x})[0]
+
+
+# 通过 NumPy 推理引擎推理，BatchNormalization 在载入时已合并到卷积中
+class NumpyBackend(EmotionBackend):
+
+    def __init__(self, path: str) -> None:
+        from engine import NumpyEngine
+        self.engine = NumpyEngine(path)
+        self.input_shape = self.engine.input_shape
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        return self.engine.predict(x)
+
+
+# 通过 TensorFlow Lite 推理量化模型
+# 优先使用独立的 tflite_runtime，没有安装时使用 TensorFlow 自带的解释器
+class TFLiteBackend(EmotionBackend):
+
+    def __init__(self, path: str) -> None:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.interpreter = Interpreter(model_path=path,
+                                       num_threads=os.cpu_count())
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.input_shape = (None, *self.input['shape'][1:])
+        self.batch = 0  # 当前分配的批量
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        # 批量改变时重新分配张量
+        if len(x) != self.batch:
+            self.interpreter.resize_tensor_input(self.input['index'],
+                                                 (len(x), *x.shape[1:]))
+            self.interpreter.allocate_tensors()
+            self.batch = len(x)
+        self.interpreter.set_tensor(self.input['index'],
+                                    np.ascontiguousarray(x, np.float32))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output['index']).copy()
+
+
+# 后端名称与实现类、所需模型格式的对应关系
+# 量化模型与 Keras 模型同名，扩展名为 .float16.tflite 或 .int8.tflite
+BACKENDS = {
+    'keras': (KerasBackend, 'hdf5'),
+    'keras_call': (KerasCallBackend, 'hdf5'),
+    'opencv': (OpenCVBackend, 'onnx'),
+    'onnx': (ONNXBackend, 'onnx'),
+    'numpy': (NumpyBackend, 'hdf5'),
+    'tflite_float16': (TFLiteBackend, 'float16.tflite'),
+    'tflite_int8': (TFLiteBackend, 'int8.tflite'),
+}
+
+
+# 将 Keras 模型一次性导出为 ONNX 文件
+def exportONNX(path_keras: str, path_onnx: str) -> None:
+    import tensorflow as tf
+    import tf2onnx
+    from keras.models import load_model
+
+    model = load_model(path_keras, compile=False)
+    spec = (tf.TensorSpec(model.input_shape, tf.float32, name='input'), )
+    tf2onnx.convert.from_keras(model,
+                               input_signature=spec,
+                               opset=13,
+                               output_path=path_onnx)
+    print(f'已导出 {path_onnx}')
+
+
+# 推理后端实际读取的模型文件
+def modelPath(name: str, path_keras: str, path_onnx: str) -> str:
+    if name not in BACKENDS:
+        raise ValueError(f'未知的推理后端 {name}，可选 {tuple(BACKENDS)}')
+    fmt = BACKENDS[name][1]
+    if fmt == 'hdf5':
+        return path_keras
+    if fmt.endswith('.tflite'):
+        return os.path.splitext(path_keras)[0] + '.' + fmt
+    return path_onnx
+
+
+# 根据名称创建推理后端
+def loadBackend(name: str, path_keras: str,
+                path_onnx: str) -> EmotionBackend:
+    path = modelPath(name, path_keras, path_onnx)
+    backend, fmt = BACKENDS[name]
+    if fmt.endswith('.tflite') and not os.path.exists(path):
+        raise FileNotFoundError(
+            f'找不到量化模型 {path}，请先运行 python models/quantize.py')
+    if fmt == 'onnx' and not os.path.exists(path):
+        exportONNX(path_keras, path)
+    return backend(path)
+
+
+# 单独运行本文件时导出 ONNX 模型
+# python backend.py [model.hdf5] [model.onnx]
+if __name__ == '__main__':
+    path_keras = (sys.argv[1] if len(sys.argv) > 1 else
+                  'models/model_emotion/fer2013_mini_XCEPTION.95-0.70.hdf5')
+    path_onnx = (sys.argv[2] if len(sys.argv) > 2 else
+                 os.path.splitext(path_keras)[0] + '.onnx')
+    exportONNX(path_keras, path_onnx)
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+# 基于机器视觉的人脸表情识别系统设计-汪哲文毕业设计
+#
+# batch.py
+# 本文件为表现层，提供不依赖图形界面的批量识别命令行入口
+# 使用进程池在所有 CPU 核心上并行识别，每张人脸输出一行结果
+#
+# python batch.py images <目录或通配符> [-o 结果.jsonl|结果.csv] [-a 标注目录] [-j 进程数]
+# python batch.py video <视频文件> [-o 时间线.jsonl|时间线.csv] [-j 进程数] [-s 步长]
+#
+# initWorker
+# 进程池的初始化函数，限制每个进程的线程数并载入模型
+#
+# faceRows
+# 将识别结果整理为每张人脸一行的记录
+#
+# recognizeImage
+# 识别单张图像，返回每张人脸的位置、微表情和七种表情的概率
+#
+# analyseSegment
+# 识别视频的一个片段，相邻多帧的人脸合并到同一批次中识别
+#
+# listImages
+# 根据目录或通配符列出需要识别的图像
+#
+# ResultWriter
+# 将识别结果逐行写入 JSONL 或 CSV 文件
+#
+# runImages
+# 用进程池识别所有图像并写出结果
+#
+# runVideo
+# 将视频切分为多个片段，用进程池并行识别，按帧顺序写出表情时间线
+#
+# 最后更新时间 2026/10/18
+
+import argparse
+import csv
+import glob
+import json
+from math import ceil
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from data import Models, EMOTION_BATCH_SIZE, EMOTION_LABELS, VIDIO_STRIDE
+from visualmodule import Recognizer, VideoReader
+
+# 支持的图像格式
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# 输出文件的表头
+FIELDS_FACE = ('face', 'x1', 'y1', 'x2', 'y2', 'label',
+               *EMOTION_LABELS.values())
+FIELDS_IMAGE = ('file', *FIELDS_FACE)
+FIELDS_VIDEO = ('frame', 'time', *FIELDS_FACE)
+
+# 标注后图像的保存目录，由 initWorker 在每个进程中设置
+ANNOTATE = None
+
+
+# 进程池的初始化函数，限制每个进程的线程数并载入模型
+# 并行由进程池负责，每个进程只用一个线程，避免线程数超过核心数
+def initWorker(annotate: str | None) -> None:
+    global ANNOTATE
+    ANNOTATE = annotate
+    os.environ['OMP_NUM_THREADS'] = '1'
+    os.environ['TF_NUM_INTRAOP_THREADS'] = '1'
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    cv2.setNumThreads(1)
+    sys.stdout = sys.stderr  # 识别器的打印信息不能混入标准输出的结果
+    Models.load()
+
+
+# 将识别结果整理为每张人脸一行的记录，info 为每行共有的信息
+def faceRows(emotions: list[tuple], info: dict) -> list[dict]:
+    rows = []
+    combos, confidences = Recognizer.microexpressions(
+        np.array([emotion for *_, emotion in emotions]))
+    for i, (x1, y1, x2, y2, emotion) in enumerate(emotions):
+        row = {
+            **info,
+            'face': i,
+            'x1': int(x1),
+            'y1': int(y1),
+            'x2': int(x2),
+            'y2': int(y2),
+            'label': Recognizer.microLabel(combos[i], confidences[i])
+        }
+        row.update((EMOTION_LABELS[j], round(float(emotion[j]), 6))
+                   for j in range(len(EMOTION_LABELS)))
+        rows.append(row)
+    return rows
+
+
+# 识别单张图像，返回每张人脸的位置、微表情和七种表情的概率
+def recognizeImage(path: str) -> tuple[str, list[dict], str]:
+    try:
+        image = cv2.imdecode(np.fromfile(path, dtype=np.uint8),
+                             cv2.IMREAD_COLOR)
+    except (OSError, cv2.error) as e:  # 文件无法读取，或内容为空、损坏
+        return path, [], str(e)
+    if image is None:
+        return path, [], '无法解码图像'
+
+    img_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    faces = Recognizer.getFace(img_gray)
+    emotions = Recognizer.getEmotion(img_gray, faces)
+    rows = faceRows(emotions, {'file': path})
+
+    # 按需保存标注后的图像
+    if ANNOTATE and len(emotions) > 0:
+        result, _ = Recognizer.markEmotion(image, emotions)
+        name = os.path.basename(path)
+        ext = os.path.splitext(name)[1]
+        ret, buffer = cv2.imencode(ext, result)
+        if ret:
+            buffer.tofile(os.path.join(ANNOTATE, name))
+    return path, rows, ''
+
+
+# 识别视频的一个片段 [start, end)，相邻多帧的人脸合并到同一批次中识别
+def analyseSegment(task: tuple[str, int, int, int, int]) -> list[dict]:
+    path, start, end, stride, batch_size = task
+    capture = cv2.VideoCapture(path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    if start > 0:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, start)  # 每个片段只定位一次
+    reader = VideoReader(capture, stride, 0)
+
+    rows = []
+    frames, crops = [], []  # 等待识别的帧信息和人脸图像
+
+    # 识别所有等待中的人脸，并按帧整理结果
+    def flush() -> None:
+        emotions = Recognizer.predictEmotion(crops, batch_size)
+        offset = 0
+        for index, boxes in frames:
+            result = [(*box, emotion) for box, emotion in zip(
+                boxes, emotions[offset:offset + len(boxes)])]
+            offset += len(boxes)
+            rows.extend(
+                faceRows(result, {
+                    'frame': index,
+                    'time': round(index / fps, 3)
+                }))
+        frames.clear()
+        crops.clear()
+
+    while True:
+        ret, frame = reader.read()
+        index = start + reader.position
+        if ret is False or index >= end:
+            break
+        img_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        boxes, faces = Recognizer.cropFace(img_gray,
+                                           Recognizer.getFace(img_gray))
+        if len(boxes) == 0:
+            continue
+        frames.append((index, boxes))
+        crops.extend(faces)
+        if len(crops) >= batch_size:
+            flush()
+    flush()
+    capture.release()
+    return rows
+
+
+# 根据目录或通配符列出需要识别的图像
+def listImages(source: str) -> list[str]:
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(source, '**', '*'), recursive=True)
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(p for p in paths
+                  if os.path.splitext(p)[1].lower() in IMAGE_EXTS)
+
+
+# 将识别结果逐行写入 JSONL 或 CSV 文件
+class ResultWriter():
+
+    def __init__(self, path: str | None, fields: tuple[str, ...]) -> None:
+        self.file = (sys.stdout if path is None else open(
+            path, 'w', encoding='utf-8', newline=''))
+        self.csv = None
+        if path is not None and path.lower().endswith('.csv'):
+            self.csv = csv.DictWriter(self.file, fields)
+            self.csv.writeheader()
+
+    def write(self, rows: list[dict]) -> None:
+        for row in rows:
+            if self.csv is None:
+                self.file.write(json.dumps(row, ensure_ascii=False) + '\n')
+            else:
+                self.csv.writerow(row)
+
+    def close(self) -> None:
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+# 用进程池识别所有图像并写出结果
+def runImages(args: argparse.Namespace) -> None:
+    paths = listImages(args.source)
+    if len(paths) == 0:
+        print(f'找不到图像 {args.source}', file=sys.stderr)
+        return
+    if args.annotate:
+        os.makedirs(args.annotate, exist_ok=True)
+
+    writer = ResultWriter(args.output, FIELDS_IMAGE)
+    faces = errors = 0
+    with multiprocessing.Pool(args.jobs, initWorker,
+                              (args.annotate, )) as pool:
+        results = pool.imap_unordered(recognizeImage, paths, args.chunk)
+        for i, (path, rows, error) in enumerate(results, 1):
+            if error:
+                errors += 1
+                print(f'{path}: {error}', file=sys.stderr)
+            faces += len(rows)
+            writer.write(rows)
+            if i % 100 == 0 or i == len(paths):
+                print(f'[{i}/{len(paths)}] 人脸 {faces} 失败 {errors}',
+                      file=sys.stderr)
+    writer.close()
+
+
+# 将视频切分为多个片段，用进程池并行识别，按帧顺序写出表情时间线
+def runVideo(args: argparse.Namespace) -> None:
+    capture = cv2.VideoCapture(args.source)
+    if capture.isOpened() is False:
+        print(f'找不到视频 {args.source}', file=sys.stderr)
+        return
+    total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    capture.release()
+
+    # 片段长度取步长的整数倍，保证各片段抽取的帧与顺序处理时一致
+    # 帧数未知时不切分视频
+    segments = args.segments or args.jobs * 4
+    if total <= 0:
+        tasks = [(args.source, 0, sys.maxsize, args.stride, args.batch)]
+    else:
+        length = ceil(total / segments / args.stride) * args.stride
+        tasks = [(args.source, start, min(start + length, total),
+                  args.stride, args.batch)
+                 for start in range(0, total, length)]
+
+    writer = ResultWriter(args.output, FIELDS_VIDEO)
+    faces = 0
+    begin = time.time()
+    with multiprocessing.Pool(args.jobs, initWorker, (None, )) as pool:
+        for i, rows in enumerate(pool.imap(analyseSegment, tasks), 1):
+            faces += len(rows)
+            writer.write(rows)
+            print(f'[{i}/{len(tasks)}] 人脸 {faces}', file=sys.stderr)
+    writer.close()
+
+    elapsed = time.time() - begin
+    print(f'用时 {elapsed:.1f} 秒，视频时长 {total / fps:.1f} 秒，'
+          f'速度为实时的 {total / fps / elapsed:.1f} 倍',
+          file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='人脸表情批量识别')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    images = commands.add_parser('images', help='识别目录或通配符中的所有图像')
+    images.add_argument('source', help='图像目录或通配符，如 "archive/**/*.jpg"')
+    images.add_argument('-o',
+                        '--output',
+                        help='结果文件，.csv 结尾时输出 CSV，默认输出 JSONL 到标准输出')
+    images.add_argument('-a', '--annotate', help='保存标注后图像的目录')
+    images.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='进程数，默认为 CPU 核心数')
+    images.add_argument('--chunk', type=int, default=16,
+                        help='每次分发给进程的图像数')
+    images.set_defaults(run=runImages)
+
+    video = commands.add_parser('video', help='离线分析视频，输出逐帧的表情时间线')
+    video.add_argument('source', help='视频文件')
+    video.add_argument('-o',
+                       '--output',
+                       help='时间线文件，.csv 结尾时输出 CSV，默认输出 JSONL 到标准输出')
+    video.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                       help='进程数，默认为 CPU 核心数')
+    video.add_argument('-s', '--stride', type=int, default=VIDIO_STRIDE,
+                       help='每隔多少帧分析一帧')
+    video.add_argument('-b', '--batch', type=int, default=EMOTION_BATCH_SIZE,
+                       help='表情识别的批量，多帧的人脸合并识别')
+    video.add_argument('--segments', type=int,
+                       help='视频切分的片段数，默认为进程数的 4 倍')
+    video.set_defaults(run=runVideo)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+
+# 基于机器视觉的人脸表情识别系统设计-汪哲文毕业设计
+#
+# benchmark.py
+# 本文件为表现层，提供识别流程各个环节的性能测试命令行入口
+# 输入为 assets 中的图像和按多种分辨率生成的合成画面，结果以 JSON 输出，便于对比各版本的性能
+#
+# python benchmark.py [-o 结果.json] [-r 重复次数] [--stages face,emotion] [--compare 旧结果.json]
+#
+# measure
+# 重复执行一个环节并记录每次的耗时
+#
+# summarize
+# 统计耗时的均值、p50/p95/p99 和吞吐量
+#
+# loadAssets
+# 读取 assets 中的图像
+#
+# syntheticFrame
+# 将人脸图像放入指定分辨率的背景中，生成合成画面
+#
+# parseResolutions
+# 解析分辨率列表
+#
+# faceFrame
+# 找出第一个能检测到人脸的画面
+#
+# benchFace / benchEmotion / benchMicro / benchMark / benchImage / benchVideo
+# 分别测试人脸检测、表情识别、微表情计算、图像标记、单张图像和视频帧的完整流程
+#
+# compareResults
+# 与旧的测试结果对比，列出 p50 变慢超过阈值的环节
+#
+# 最后更新时间 2026/10/18
+
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Iterable
+
+import cv2
+import numpy as np
+
+import data
+from data import Models, EMOTION_LABELS
+from visualmodule import Recognizer
+
+ASSETS = 'assets'
+RESOLUTIONS = '320x240,640x480,1280x720,1920x1080'
+EMOTION_BATCHES = (1, 8, 32)
+STAGES = ('face', 'emotion', 'micro', 'mark', 'image', 'video')
+
+
+# 重复执行一个环节并记录每次的耗时（毫秒），先预热一次
+def measure(fn: Callable, inputs: Iterable, repeat: int) -> list[float]:
+    inputs = list(inputs)
+    fn(inputs[0])
+    samples = []
+    for _ in range(repeat):
+        for x in inputs:
+            begin = time.perf_counter()
+            fn(x)
+            samples.append((time.perf_counter() - begin) * 1000)
+    return samples
+
+
+# 统计耗时的均值、p50/p95/p99 和吞吐量，items 为每次执行处理的数量
+def summarize(stage: str, name: str, samples: list[float],
+              items: int = 1) -> dict:
+    p50, p95, p99 = np.percentile(samples, (50, 95, 99))
+    mean = float(np.mean(samples))
+    result = {
+        'stage': stage,
+        'input': name,
+        'items': items,
+        'runs': len(samples),
+        'mean_ms': round(mean, 4),
+        'p50_ms': round(float(p50), 4),
+        'p95_ms': round(float(p95), 4),
+        'p99_ms': round(float(p99), 4),
+        'throughput': round(items * 1000 / mean, 2) if mean > 0 else None,
+    }
+    print(f'{stage:<24}{name:<28} p50 {p50:9.3f} ms  '
+          f'p95 {p95:9.3f} ms  {result["throughput"]} 个/秒',
+          file=sys.stderr)
+    return result
+
+
+# 读取 assets 中的图像，返回 (文件名, BGR 图像)
+def loadAssets(folder: str = ASSETS) -> list[tuple[str, np.ndarray]]:
+    images = []
+    for path in sorted(glob.glob(os.path.join(folder, '*'))):
+        if os.path.splitext(path)[1].lower() not in ('.png', '.jpg', '.jpeg'):
+            continue
+        image = cv2.imdecode(np.fromfile(path, dtype=np.uint8),
+                             cv2.IMREAD_COLOR)
+        if image is not None:
+            images.append((os.path.basename(path), image))
+    return images
+
+
+# 将人脸图像放入指定分辨率的背景中，生成合成画面，shift 用于模拟视频中人脸的移动
+def syntheticFrame(face: np.ndarray, width: int, height: int,
+                   shift: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    frame = rng.integers(60, 120, (height, width, 3), np.uint8)
+    frame = cv2.GaussianBlur(frame, (0, 0), 3)
+    scale = min(height / 2 / face.shape[0], width / 3 / face.shape[1])
+    face = cv2.resize(face, None, fx=scale, fy=scale,
+                      interpolation=cv2.INTER_AREA)
+    h, w = face.shape[:2]
+    x = (width - w) // 2 + shift % max(width // 4, 1) - width // 8
+    y = (height - h) // 2
+    frame[y:y + h, x:x + w] = face
+    return frame
+
+
+# 解析分辨率列表，如 640x480,1280x720
+def parseResolutions(text: str) -> list[tuple[int, int]]:
+    return [tuple(int(v) for v in item.split('x'))  # type: ignore
+            for item in text.split(',') if item]
+
+
+# 找出第一个能检测到人脸的画面，返回 (名称, 图像, 灰度图像, 人脸)
+def faceFrame(frames) -> tuple:
+    for name, image in frames:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        faces = Recognizer.getFace(gray)
+        if len(faces) > 0:
+            return name, image, gray, faces
+    return None, None, None, []
+
+
+# 人脸检测：CLAHE 和 getFace
+def benchFace(assets, frames, repeat) -> list[dict]:
+    results = []
+    for name, image in assets + frames:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        results.append(
+            summarize('clahe', name,
+                      measure(data.CLAHE_FACE.apply, [gray], repeat)))
+        results.append(
+            summarize('getFace', name,
+                      measure(Recognizer.getFace, [gray], repeat)))
+    return results
+
+
+# 表情识别：按不同的批量识别同一画面中的人脸
+def benchEmotion(assets, frames, repeat) -> list[dict]:
+    results = []
+    name, image, gray, faces = faceFrame(assets + frames)
+    if len(faces) == 0:
+        print('找不到人脸，跳过表情识别测试', file=sys.stderr)
+        return results
+    for batch in EMOTION_BATCHES:
+        boxes = (faces * batch)[:batch]
+        results.append(
+            summarize(
+                f'getEmotion/batch{batch}', name,
+                measure(lambda b: Recognizer.getEmotion(gray, b, batch),
+                        [boxes], repeat), batch))
+    return results
+
+
+# 微表情计算：逐张人脸计算和一次计算一批人脸
+def benchMicro(assets, frames, repeat) -> list[dict]:
+    rng = np.random.default_rng(0)
+    origin = rng.dirichlet(np.ones(len(EMOTION_LABELS)),
+                           256).astype(np.float32)
+    return [
+        summarize('microexpression', 'random',
+                  measure(Recognizer.microexpression, origin[:32], repeat)),
+        summarize('microexpressions', 'random x256',
+                  measure(Recognizer.microexpressions, [origin], repeat),
+                  len(origin)),
+    ]
+
+
+# 图像标记：putText_CN 和 markEmotion
+def benchMark(assets, frames, repeat) -> list[dict]:
+    results = []
+    name, image, gray, faces = faceFrame(frames + assets)
+    if len(faces) == 0:
+        print('找不到人脸，跳过图像标记测试', file=sys.stderr)
+        return results
+    emotions = Recognizer.getEmotion(gray, faces)
+    results.append(
+        summarize(
+            'putText_CN', name,
+            measure(lambda x: Recognizer.putText_CN(x, '快乐', (10, 10)),
+                    [image.copy()], repeat)))
+    results.append(
+        summarize(
+            'markEmotion', name,
+            measure(lambda x: Recognizer.markEmotion(x, list(emotions)),
+                    [image.copy()], repeat), len(emotions)))
+    return results
+
+
+# 单张图像的完整流程，与图像识别器一致
+# 测试期间关闭识别结果缓存，否则预热之后每次都直接取出缓存的结果
+def benchImage(assets, frames, repeat) -> list[dict]:
+    from cache import ResultCache
+    from recognizer import RecImage
+
+    def detect(image: np.ndarray) -> None:
+        RecImage.img_origin = image
+        RecImage.detectImg()
+
+    size, disk = ResultCache.size, ResultCache.disk
+    ResultCache.size, ResultCache.disk = 0, ''
+    ResultCache.clear()
+    try:
+        return [
+            summarize('image', name, measure(detect, [image], repeat))
+            for name, image in assets
+        ]
+    finally:
+        ResultCache.size, ResultCache.disk = size, disk
+
+
+# 视频帧的完整流程，与视频识别器一致，包括两次检测之间的人脸跟踪
+def benchVideo(assets, frames, repeat, count: int = 60) -> list[dict]:
+    from recognizer import RecVidio
+
+    results = []
+    face = assets[0][1]
+    for name, image in frames:
+        height, width = image.shape[:2]
+        video = [
+            syntheticFrame(face, width, height, shift * 2)
+            for shift in range(count)
+        ]
+        samples = []
+        for _ in range(max(repeat // 10, 1)):
+            RecVidio.emotion_freq = 0
+            RecVidio.img_prev = None
+            # processFrame 会在画面上直接标记，每次传入副本，各轮检测的都是原始画面
+            samples += measure(lambda x: RecVidio.processFrame(x.copy()),
+                               video, 1)
+        results.append(summarize('video', name, samples))
+    return results
+
+
+BENCHES = {
+    'face': benchFace,
+    'emotion': benchEmotion,
+    'micro': benchMicro,
+    'mark': benchMark,
+    'image': benchImage,
+    'video': benchVideo,
+}
+
+
+# 与旧的测试结果对比，列出 p50 变慢超过阈值的环节，返回变慢的环节数
+def compareResults(path: str, results: list[dict], threshold: float) -> int:
+    with open(path, encoding='utf-8') as f:
+        baseline = {(r['stage'], r['input']): r for r in json.load(f)['results']}
+    slower = 0
+    for r in results:
+        old = baseline.get((r['stage'], r['input']))
+        if old is None or old['p50_ms'] <= 0:
+            continue
+        ratio = r['p50_ms'] / old['p50_ms']
+        if ratio > 1 + threshold:
+            slower += 1
+            print(f'变慢 {r["stage"]} {r["input"]}: '
+                  f'{old["p50_ms"]} -> {r["p50_ms"]} ms ({ratio:.2f} 倍)',
+                  file=sys.stderr)
+    return slower
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='人脸表情识别性能测试')
+    parser.add_argument('-o', '--output', help='结果文件，默认输出 JSON 到标准输出')
+    parser.add_argument('-r', '--repeat', type=int, default=20,
+                        help='每个输入重复执行的次数')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f'需要测试的环节，可选 {",".join(STAGES)}')
+    parser.add_argument('--resolutions', default=RESOLUTIONS,
+                        help='合成画面的分辨率列表')
+    parser.add_argument('--assets', default=ASSETS, help='测试图像所在的目录')
+    parser.add_argument('--backend', help='表情识别的推理后端，默认为 data.py 中的设置')
+    parser.add_argument('--compare', help='与旧的结果文件对比，p50 变慢超过阈值时返回 1')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='对比时允许的变慢比例')
+    args = parser.parse_args()
+
+    stages = [s for s in args.stages.split(',') if s]
+    for stage in stages:
+        if stage not in BENCHES:
+            parser.error(f'未知的环节 {stage}，可选 {",".join(STAGES)}')
+
+    output = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # 屏蔽识别器逐张人脸的打印信息
+    if args.backend:
+        data.EMOTION_BACKEND = args.backend
+    Models.load()
+
+    assets = loadAssets(args.assets)
+    if len(assets) == 0:
+        parser.error(f'{args.assets} 中找不到图像')
+    frames = [(f'synthetic {w}x{h}', syntheticFrame(assets[0][1], w, h))
+              for w, h in parseResolutions(args.resolutions)]
+
+    results = []
+    for stage in stages:
+        results += BENCHES[stage](assets, frames, args.repeat)
+
+    report = {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'cpu_count': os.cpu_count(),
+        'backend': data.EMOTION_BACKEND,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        output.write(text + '\n')
+
+    if args.compare and compareResults(args.compare, results,
+                                       args.threshold) > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+# 基于机器视觉的人脸表情识别系统设计-汪哲文毕业设计
+#
+# cache.py
+# 本文件为数据层，负责缓存图像的识别结果，同一张图像再次识别时直接取出结果
+# 缓存以图像内容的哈希值和识别参数为键，模型文件或参数改变后旧的结果自动失效
+#
+# ResultCache
+# 识别结果的两级缓存，内存中为 LRU 缓存，磁盘上为可选的有容量上限的缓存
+#
+# key
+# 根据图像内容、检测参数和模型文件计算缓存的键
+#
+# fingerprint
+# 汇总影响识别结果的参数和模型文件的修改时间
+#
+# get
+# 取出缓存的识别结果，依次查找内存和磁盘
+#
+# put
+# 存入识别结果，同时写入内存和磁盘
+#
+# putMemory / clear
+# 写入和清空内存中的 LRU 缓存
+#
+# loadDisk / saveDisk
+# 读写磁盘上的缓存文件，每张图像的结果保存为一个 npz 文件
+#
+# trimDisk
+# 磁盘缓存超过容量上限时删除最久未使用的结果
+#
+# 最后更新时间 2026/10/18
+
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from backend import modelPath
+import data
+import visualmodule
+from data import EMOTION_LABELS, RESULT_CACHE_SIZE, RESULT_CACHE_DISK, RESULT_CACHE_DISK_SIZE
+
+
+# 识别结果的两级缓存
+# 结果为 (x1, y1, x2, y2, 七种表情的概率) 的列表，与 getEmotion 的返回值一致
+class ResultCache():
+    memory: OrderedDict = OrderedDict()
+    size = RESULT_CACHE_SIZE  # 内存中缓存的图像数量，0 表示不缓存
+    disk = RESULT_CACHE_DISK  # 磁盘缓存的目录，空字符串表示不使用磁盘
+    disk_size = RESULT_CACHE_DISK_SIZE  # 磁盘缓存的容量上限（字节）
+    lock = threading.Lock()
+
+    # 根据图像内容、检测参数和模型文件计算缓存的键
+    @classmethod
+    def key(cls, image: np.ndarray) -> str:
+        image = np.ascontiguousarray(image)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f'{image.shape}{image.dtype}'.encode())
+        digest.update(image.data)
+        digest.update(cls.fingerprint().encode())
+        return digest.hexdigest()
+
+    # 汇总影响识别结果的参数和模型文件的修改时间
+    # 检测参数取 visualmodule 中实际使用的值，它们是导入 data 时复制过去的，改动 data 中的值不会影响识别
+    # 表情模型的后端由 Models.load 在启动时按 data.EMOTION_BACKEND 载入
+    @classmethod
+    def fingerprint(cls) -> str:
+        params = [data.EMOTION_BACKEND]
+        params.extend(
+            getattr(visualmodule, name) for name in (
+                'FACE_SCALE_FACTOR', 'FACE_MIN_NEIGHBORS', 'FACE_MIN_SIZE',
+                'FACE_MAX_SIZE', 'FACE_DETECT_SCALE', 'FACE_DETECT_MARGIN',
+                'FACE_MIN_FACE', 'FACE_TILE_SIZE', 'FACE_TILE_OVERLAP',
+                'FACE_TILE_COVER', 'FACE_TILE_IOU', 'FACE_SUPPRESS_RATIO',
+                'FACE_SUPPRESS_OVERLAP', 'FACE_SUPPRESS_IOU'))
+        params.append(visualmodule.CLAHE_FACE.getClipLimit())
+        params.append(visualmodule.CLAHE_FACE.getTilesGridSize())
+        # 表情模型取当前后端实际读取的文件，量化模型重新生成后旧结果同样失效
+        emotion = modelPath(data.EMOTION_BACKEND, data.MODEL_EMOTION,
+                            data.MODEL_EMOTION_ONNX)
+        for path in (data.MODEL_FACE, data.MODEL_EMOTION, emotion):
+            try:
+                stat = os.stat(path)
+                params.append((path, stat.st_size, stat.st_mtime_ns))
+            except OSError:  # ONNX 模型可能尚未导出
+                params.append((path, None))
+        return repr(params)
+
+    # 取出缓存的识别结果，依次查找内存和磁盘，没有缓存时返回 None
+    @classmethod
+    def get(cls, key: str) -> list[tuple] | None:
+        with cls.lock:
+            if key in cls.memory:
+                cls.memory.move_to_end(key)
+                return list(cls.memory[key])
+        result = cls.loadDisk(key)
+        if result is not None:
+            cls.putMemory(key, result)
+        return result
+
+    # 存入识别结果，同时写入内存和磁盘
+    @classmethod
+    def put(cls, key: str, emotions: list[tuple]) -> None:
+        result = [(int(x1), int(y1), int(x2), int(y2),
+                   np.array(emotion, np.float32))
+                  for x1, y1, x2, y2, emotion in emotions]
+        cls.putMemory(key, result)
+        cls.saveDisk(key, result)
+
+    # 写入内存缓存，超过数量上限时淘汰最久未使用的结果
+    @classmethod
+    def putMemory(cls, key: str, result: list[tuple]) -> None:
+        if cls.size <= 0:
+            return
+        with cls.lock:
+            cls.memory[key] = tuple(result)
+            cls.memory.move_to_end(key)
+            while len(cls.memory) > cls.size:
+                cls.memory.popitem(last=False)
+
+    # 清空内存缓存，磁盘缓存保留
+    @classmethod
+    def clear(cls) -> None:
+        with cls.lock:
+            cls.memory.clear()
+
+    # 从磁盘读取识别结果，文件损坏时视为没有缓存
+    @classmethod
+    def loadDisk(cls, key: str) -> list[tuple] | None:
+        if not cls.disk:
+            return None
+        path = os.path.join(cls.disk, key + '.npz')
+        try:
+            with np.load(path, allow_pickle=False) as f:
+                boxes, emotions = f['boxes'], f['emotions']
+            os.utime(path)  # 更新修改时间，按最近使用的顺序淘汰
+        except (OSError, KeyError, ValueError):
+            return None
+        return [(*box, emotion)
+                for box, emotion in zip(boxes.tolist(), emotions)]
+
+    # 将识别结果写入磁盘，先写入临时文件再替换，避免读到写了一半的文件
+    @classmethod
+    def saveDisk(cls, key: str, result: list[tuple]) -> None:
+        if not cls.disk:
+            return
+        os.makedirs(cls.disk, exist_ok=True)
+        boxes = np.array([r[:4] for r in result], np.int32).reshape(-1, 4)
+        emotions = np.array([r[4] for r in result],
+                            np.float32).reshape(-1, len(EMOTION_LABELS))
+        path = os.path.join(cls.disk, key + '.npz')
+        temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(temp, 'wb') as f:
+                np.savez(f, boxes=boxes, emotions=emotions)
+            os.replace(temp, path)
+        except OSError as e:
+            print(f'识别结果缓存写入失败 {e!r}')
+            return
+        cls.trimDisk()
+
+    # 磁盘缓存超过容量上限时删除最久未使用的结果
+    @classmethod
+    def trimDisk(cls) -> None:
+        files = []
+        with os.scandir(cls.disk) as entries:
+            for entry in entries:
+                if entry.name.endswith('.npz'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= cls.disk_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
@@ -7,13 +7,20 @@
 # 并将逻辑层反馈的数据传递回表现层
 #
 # Controller
-# 识别器的控制器，用于对外提供接口并协调三个识别器的工作状态
+# 识别器的控制器，用于对外提供接口并协调四个识别器的工作状态
 #
 # radio_set
 # 根据给定的索引设置语音识别器类型，并相应地更新用户界面状态
 #
 # prepare
 # 初始化和重置界面元素状态以准备开始任务
+# 模型在后台线程中载入，载入完成后才允许开始识别
+#
+# prepared
+# 接收模型载入的进度，全部完成后启用模型
+#
+# prepareFailed
+# 模型载入失败，允许重新载入
 #
 # loadImg
 # 根据当前模型状态加载图像，处理图像加载过程中的各种结果
@@ -21,17 +28,53 @@
 #
 # detectImg
 # 识别图像中的人脸并进行相应处理
+# 视频和摄像头的连续画面交给后台线程处理，不阻塞界面
+#
+# detected
+# 接收后台线程发来的最新识别结果
+#
+# showResult
+# 根据识别结果更新界面，返回识别器是否需要继续工作
+#
+# stopWorker
+# 停止后台识别线程
+#
+# close
+# 关闭窗口前停止所有后台线程
+#
+# showImg
+# 将识别器当前的图像直接交给图像框显示，不经过磁盘读写
 #
-# 最后更新时间 2024/05/17
+# drawStats
+# 在画面左上角绘制帧率和各环节耗时，只绘制在界面上，不影响导出的图像
+#
+# setStats
+# 开启或关闭各环节的耗时统计，以及图像框上的叠加显示
+#
+# stats
+# 返回各环节耗时的统计结果
+#
+# dumpStats
+# 将耗时统计和直方图导出为 JSON 文件
+#
+# exportImg
+# 将图像框中的图像导出到用户选择的路径
+#
+# 最后更新时间 2026/10/18
 
-from PyQt5.QtWidgets import QLabel, QPushButton
+import numpy as np
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor, QImage, QPainter, QPixmap
+from PyQt5.QtWidgets import QFileDialog, QLabel, QPushButton
 
-from data import Result, RECOGNIZER_TYPE, PATH_RESULT, PATH_ORIGIN
+from data import Result, Models, RECOGNIZER_TYPE, PATH_RESULT, PATH_STATS
 from framework import AbstractRecognizer
-from recognizer import RecImage, RecVidio, RecCamera
+from recognizer import RecImage, RecVidio, RecCamera, RecMulti
+from stats import Stats
+from worker import DetectWorker, ModelLoader
 
 
-# 识别器的控制器，用于对外提供接口并协调三个识别器的工作状态
+# 识别器的控制器，用于对外提供接口并协调四个识别器的工作状态
 class Controller():
     _instance = None
     mode: tuple[type]
@@ -40,6 +83,10 @@ class Controller():
     imageBox: QLabel
     textBox: QLabel
     startButton: QPushButton
+    prepareButton: QPushButton
+    loader: ModelLoader | None = None
+    worker: DetectWorker | None = None
+    overlay = False  # 是否在图像框上叠加显示耗时统计
 
     def __new__(cls, *args, **kw):
         if not cls._instance:
@@ -47,7 +94,9 @@ class Controller():
         return cls._instance
 
     @classmethod
-    def __init__(cls, mode=(RecImage, RecVidio, RecCamera), index=0) -> None:
+    def __init__(cls,
+                 mode=(RecImage, RecVidio, RecCamera, RecMulti),
+                 index=0) -> None:
         cls.mode = mode
         cls.rec: AbstractRecognizer = mode[index]
         cls.rec.radioOn()
@@ -60,6 +109,7 @@ class Controller():
             return
 
         # 根据索引设置新的识别器类型
+        cls.stopWorker()
         cls.rec = cls.mode[RECOGNIZER_TYPE[index]](cls.rec)
         cls.enable['image'] = False
         if cls.enable['model'] is False:
@@ -72,32 +122,50 @@ class Controller():
         cls.startButton.setEnabled(all(cls.enable.values()))
 
     # 初始化和重置界面元素状态以准备开始任务
+    # 模型在后台线程中载入，载入完成后才允许开始识别
     @classmethod
     def prepare(cls, prepareButton: QPushButton, startButton: QPushButton,
                 imageBox: QLabel, textBox: QLabel) -> None:
-        # 启用模型并设置界面元素
-        cls.enable['model'] = True
         cls.imageBox = imageBox
         cls.textBox = textBox
         cls.startButton = startButton
+        cls.prepareButton = prepareButton
+        cls.prepareButton.setEnabled(False)
+        cls.loader = ModelLoader()
+        cls.loader.progress.connect(cls.prepared)
+        cls.loader.failed.connect(cls.prepareFailed)
+        cls.loader.start()
+
+    # 接收模型载入的进度，全部完成后启用模型
+    @classmethod
+    def prepared(cls, step: int, text: str) -> None:
+        if step < Models.steps:
+            cls.textBox.setText(f'[{step}/{Models.steps}] {text}')
+            return
+        cls.enable['model'] = True
         cls.startButton.setEnabled(all(cls.enable.values()))
-        prepareButton.setEnabled(False)
         cls.textBox.setText(Result.PREPARE.value)
 
+    # 模型载入失败，允许重新载入
+    @classmethod
+    def prepareFailed(cls, text: str) -> None:
+        cls.textBox.setText(text)
+        cls.prepareButton.setEnabled(True)
+
     # 根据当前模型状态加载图像，处理图像加载过程中的各种结果
     # 并更新UI状态来反映加载结果
     @classmethod
     def loadImg(cls) -> None:
         if cls.enable['model'] is False:  # 检查模型是否已载入，未载入则直接返回
             return
+        cls.stopWorker()
         res, text = cls.rec.loadImg()  # type: ignore
 
         # 根据加载图像的结果更新UI状态
         if res is Result.FINISH:  # 图像加载完成
             cls.enable['image'] = True
             cls.textBox.setText(text)
-            cls.imageBox.setStyleSheet(f'image: url(./{PATH_ORIGIN})')
-            cls.imageBox.setText('')
+            cls.showImg()
         elif res is Result.NO_FILE_SELECTED:  # 未选择文件
             cls.enable['image'] = False
             cls.textBox.setText(Result.NO_FILE_SELECTED.value)
@@ -115,8 +183,7 @@ class Controller():
             if res is Result.CAMERA_START:
                 cls.enable['image'] = True
                 cls.textBox.setText(Result.CAMERA_START.value)
-                cls.imageBox.setStyleSheet(f'image: url(./{PATH_ORIGIN})')
-                cls.imageBox.setText('')
+                cls.showImg()
             elif res is Result.CAMERA_NOT_FOUND:
                 cls.enable['image'] = False
                 cls.textBox.setText(Result.CAMERA_NOT_FOUND.value)
@@ -131,33 +198,145 @@ class Controller():
         cls.startButton.setEnabled(all(cls.enable.values()))
 
     # 识别图像中的人脸并进行相应处理
+    # 视频和摄像头的连续画面交给后台线程处理，不阻塞界面
     @classmethod
     def detectImg(cls) -> None:
+        if cls.rec.stream:  # type: ignore
+            cls.stopWorker()
+            cls.startButton.setEnabled(False)
+            cls.worker = DetectWorker(cls.rec)  # type: ignore
+            cls.worker.detected.connect(cls.detected)
+            cls.worker.start()
+            return
+
         while cls.enable['image']:
             # 调用识别函数检测图像，获取结果和识别到的文本
             res, text = cls.rec.detectImg()  # type: ignore
-            if cls.enable['image'] is False:  # 如果检测到瞬间的页面切换，则退出
-                return
-            if res is Result.FINISH:  # 识别完成，停止工作
-                cls.textBox.setText(text)
-                cls.imageBox.setStyleSheet(f'image: url(./{PATH_RESULT})')
-                break
-            elif res is Result.CONTINUE:  # 识别完成，继续工作
-                cls.textBox.setText(text)
-                cls.imageBox.setStyleSheet(f'image: url(./{PATH_RESULT})')
-            elif res is Result.FACE_NOT_FOUND:  # 找不到人脸，停止工作
-                cls.textBox.setText(Result.FACE_NOT_FOUND.value)
-                break
-            elif res is Result.FACE_NOT_FOUND_CONTINUE:  # 找不到人脸，继续工作
-                cls.textBox.setText(Result.FACE_NOT_FOUND_CONTINUE.value)
-                cls.imageBox.setStyleSheet(f'image: url(./{PATH_RESULT})')
-            else:
-                print('发生未知错误，可能是识别器无法正常工作')
-                cls.textBox.setText('数据框')
-                cls.imageBox.setStyleSheet('border: 3px solid black;')
-                cls.imageBox.setText('图像框')
+            if cls.showResult(res, text) is False:
                 break
         cls.startButton.setEnabled(all(cls.enable.values()))
 
+    # 接收后台线程发来的最新识别结果
+    @classmethod
+    def detected(cls) -> None:
+        if cls.worker is None:
+            return
+        result = cls.worker.take()
+        if result is None or cls.enable['image'] is False:  # 页面已切换
+            return
+        res, frame, text = result
+        if cls.showResult(res, text, frame) is False:
+            cls.stopWorker()
+            cls.startButton.setEnabled(all(cls.enable.values()))
+
+    # 根据识别结果更新界面，返回识别器是否需要继续工作
+    @classmethod
+    def showResult(cls, res: Result, text: str, frame=None) -> bool:
+        if res is Result.FINISH:  # 识别完成，停止工作
+            cls.textBox.setText(text)
+            cls.showImg(frame)
+            return False
+        elif res is Result.CONTINUE:  # 识别完成，继续工作
+            cls.textBox.setText(text)
+            cls.showImg(frame)
+            return True
+        elif res is Result.FACE_NOT_FOUND:  # 找不到人脸，停止工作
+            cls.textBox.setText(Result.FACE_NOT_FOUND.value)
+            return False
+        elif res is Result.FACE_NOT_FOUND_CONTINUE:  # 找不到人脸，继续工作
+            cls.textBox.setText(Result.FACE_NOT_FOUND_CONTINUE.value)
+            cls.showImg(frame)
+            return True
+        else:
+            print('发生未知错误，可能是识别器无法正常工作')
+            cls.textBox.setText('数据框')
+            cls.imageBox.setStyleSheet('border: 3px solid black;')
+            cls.imageBox.setText('图像框')
+            return False
+
+    # 停止后台识别线程
+    @classmethod
+    def stopWorker(cls) -> None:
+        if cls.worker is None:
+            return
+        cls.worker.stop()
+        cls.worker = None
+
+    # 关闭窗口前停止所有后台线程
+    @classmethod
+    def close(cls) -> None:
+        cls.stopWorker()
+        if cls.loader is not None:
+            cls.loader.wait()
+
+    # 将识别器当前的图像直接交给图像框显示，不经过磁盘读写
+    @classmethod
+    def showImg(cls, frame=None) -> None:
+        begin = Stats.clock()
+        if frame is None:
+            frame = cls.rec.frame  # type: ignore
+        frame = np.ascontiguousarray(frame)
+        height, width = frame.shape[:2]
+        image = QImage(frame.data, width, height, frame.strides[0],
+                       QImage.Format.Format_BGR888)  # 直接包装numpy缓冲区
+        pixmap = QPixmap.fromImage(image).scaled(
+            cls.imageBox.contentsRect().size(),
+            Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation)
+        if cls.overlay:
+            cls.drawStats(pixmap)
+        cls.imageBox.setStyleSheet('')
+        cls.imageBox.setPixmap(pixmap)
+        Stats.record('display', begin)
+
+    # 在缩放后的画面左上角绘制帧率和各环节的 p50/p95 耗时
+    # 只绘制在界面上，不影响导出的图像
+    @classmethod
+    def drawStats(cls, pixmap: QPixmap) -> None:
+        text = Stats.overlay()
+        painter = QPainter(pixmap)
+        font = painter.font()
+        font.setPixelSize(11)
+        painter.setFont(font)
+        rect = painter.boundingRect(pixmap.rect(), Qt.AlignmentFlag.AlignLeft,
+                                    text)
+        rect.adjust(0, 0, 8, 8)
+        painter.fillRect(rect, QColor(0, 0, 0, 160))
+        painter.setPen(QColor(0, 255, 0))
+        painter.drawText(rect.adjusted(4, 4, 0, 0), Qt.AlignmentFlag.AlignLeft,
+                         text)
+        painter.end()
+
+    # 开启或关闭各环节的耗时统计，overlay 为是否在图像框上叠加显示
+    @classmethod
+    def setStats(cls, enabled: bool, overlay: bool = True) -> None:
+        Stats.enable(enabled)
+        cls.overlay = enabled and overlay
+
+    # 返回各环节耗时的统计结果
+    @classmethod
+    def stats(cls) -> dict:
+        return Stats.summary()
+
+    # 将耗时统计和直方图导出为 JSON 文件，返回导出的路径
+    @classmethod
+    def dumpStats(cls, path: str = PATH_STATS) -> str:
+        path = Stats.dump(path)
+        print(f'耗时统计已导出到 {path}')
+        return path
+
+    # 将图像框中的图像导出到用户选择的路径
+    @classmethod
+    def exportImg(cls) -> None:
+        if cls.enable['image'] is False:  # 没有可导出的图像
+            return
+        path, _ = QFileDialog.getSaveFileName(None, 'save img', PATH_RESULT,
+                                              '*.png;;*.jpg')
+        print(path)
+        if path == '':
+            return
+        if cls.rec.saveImg(path) is False:
+            print('图像导出失败')
+
 
 controller = Controller()
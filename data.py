@@ -5,25 +5,126 @@
 # data.py
 # 本文件为数据层，负责存储底层数据常量和模型文件
 #
-# 最后更新时间 2024/04/15
+# Models
+# 模型和字体不在导入时载入，而是由 Models.load 在后台线程中载入并预热
+#
+# 最后更新时间 2026/10/18
 
 from enum import Enum
+import os
+from typing import Callable
 from cv2 import CascadeClassifier, createCLAHE
-from keras.models import load_model
+import numpy as np
 from PIL import ImageFont
+from PIL.ImageFont import FreeTypeFont
+
+from backend import EmotionBackend, loadBackend
 
 # 人脸识别和表情识别的模型路径
 MODEL_FACE = 'models/model_face/haarcascade_frontalface_default.xml'
 MODEL_EMOTION = 'models/model_emotion/fer2013_mini_XCEPTION.95-0.70.hdf5'
+MODEL_EMOTION_ONNX = 'models/model_emotion/fer2013_mini_XCEPTION.95-0.70.onnx'
 
-# 载入模型数据
+# 表情识别的推理后端，可选 keras / keras_call / opencv / onnx / numpy / tflite_float16 / tflite_int8
+# 选择 numpy 时不导入 TensorFlow，启动更快、占用内存更少
+# 选择 opencv 或 onnx 时，若 ONNX 模型不存在会先自动导出一次
+# 选择 tflite 时需先运行 models/quantize.py 生成量化模型
+EMOTION_BACKEND = 'keras'
+
+# 局部对比度增强
 CLAHE_FACE = createCLAHE(clipLimit=4.0, tileGridSize=(8, 8))
-CLASSIFIER_FACE = CascadeClassifier(MODEL_FACE)
-CLASSIFIER_EMOTION = load_model(MODEL_EMOTION, compile=False)
-CLASSIFIER_EMOTION_SIZE = CLASSIFIER_EMOTION.input_shape[1:3]  # type: ignore
+
+# 人脸检测的参数，对应 detectMultiScale 的同名参数
+# 尺寸为 (宽, 高)，(0, 0) 表示不限制
+FACE_SCALE_FACTOR = 1.3
+FACE_MIN_NEIGHBORS = 5
+FACE_MIN_SIZE = (0, 0)
+FACE_MAX_SIZE = (0, 0)
+
+# 人脸检测的分辨率，检测在缩小后的图像上进行，表情识别仍裁剪原图
+# 取值为 0~1 的缩放比例，或 'auto' 根据需要检测的最小人脸尺寸自动计算
+# 人脸缩得太小时级联分类器的召回率明显下降，因此自动模式保留 MARGIN 倍检测窗口的余量
+# 默认参数下不会缩小，高分辨率画面可按实际情况调大 FACE_MIN_FACE
+FACE_DETECT_SCALE = 'auto'
+FACE_DETECT_MARGIN = 2.0
+FACE_MIN_FACE = 48  # 需要检测的最小人脸边长（原图像素）
+
+# 大图分块并行检测的参数（检测分辨率下的像素），图块边长为 0 时不分块
+# 重叠宽度应不小于需要检测的最大人脸，保证每张人脸至少完整地出现在一个图块中
+# 图块边界处的重复人脸框按覆盖比例 COVER 和交并比 IOU 合并
+FACE_TILE_SIZE = 0
+FACE_TILE_OVERLAP = 256
+FACE_TILE_THREADS = os.cpu_count()
+FACE_TILE_COVER = 0.6
+FACE_TILE_IOU = 0.3
+
+# 人脸框非极大值抑制的参数
+# 小框被大于其 RATIO 倍的框覆盖的面积比例超过 OVERLAP 时去除，0 表示有重叠即去除
+# 两框交并比超过 IOU 时只保留较大的框，1 表示不检查重复框
+FACE_SUPPRESS_RATIO = 2.0
+FACE_SUPPRESS_OVERLAP = 0.0
+FACE_SUPPRESS_IOU = 1.0
+
+# 表情识别的最大批量，一次前向传播最多处理的人脸数量
+EMOTION_BATCH_SIZE = 32
+
+# 表情识别调度器的参数：凑批次时最多等待的秒数
+# 以及实时来源最多排队的请求数，超过后丢弃最旧的请求
+SCHEDULER_WAIT = 0.005
+SCHEDULER_PENDING = 2
+
+# 识别服务的监听地址、检测线程数、凑批次的等待时间（秒）和请求体的大小上限（字节）
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8600
+SERVER_THREADS = os.cpu_count()
+SERVER_WAIT = 0.01
+SERVER_MAX_BODY = 16 * 1024 * 1024
+
+# 多路识别的视频来源，摄像头编号或视频文件、网络视频流的地址
+# 每路画面缩放到 MULTI_TILE (宽, 高) 后拼接显示
+MULTI_SOURCES = [0, 1]
+MULTI_TILE = (640, 480)
+
+# 后台识别时帧队列的长度，队列越短界面显示的画面越新
+FRAME_QUEUE_SIZE = 2
+
+# 视频识别器每次前进的帧数，跳过的帧只解码不取出
+VIDIO_STRIDE = 3
+
+# 视频预读队列的长度，0 表示不启用预读线程
+# 界面中已有独立的采集线程，预读主要用于离线处理
+VIDIO_READAHEAD = 0
+
+# 两次人脸检测之间的帧数，期间用光流跟踪人脸框的位置
+FACE_DETECT_INTERVAL_VIDIO = 6
+FACE_DETECT_INTERVAL_CAMERA = 10
+
+# 实时识别器的画面变化检测：缩略图尺寸 (宽, 高)、平均灰度差的阈值
+# 画面变化低于阈值时沿用上一次的识别结果，但最多沿用 MAX_STALE 秒
+CHANGE_SIZE = (32, 24)
+CHANGE_THRESHOLD = 2.0
+CHANGE_MAX_STALE = 2.0
+
+# 人脸跟踪的参数：每张人脸的特征点数、前后向误差上限（像素）
+# 以及最低置信度，置信度低于该值时立即重新检测人脸
+TRACK_POINTS = 30
+TRACK_ERROR = 1.0
+TRACK_CONFIDENCE = 0.5
+
+# 各环节耗时统计，默认关闭，可在界面中按 F3 开启
+# 每个环节只保留最近 WINDOW 次的耗时，导出时按对数间隔的 BINS 个区间统计直方图
+STATS_ENABLED = False
+STATS_WINDOW = 300
+STATS_BINS = 24
+
+# 图像识别结果的缓存：内存中缓存的图像数量，以及磁盘缓存的目录和容量上限（字节）
+# 目录为空字符串时只使用内存缓存
+RESULT_CACHE_SIZE = 64
+RESULT_CACHE_DISK = ''
+RESULT_CACHE_DISK_SIZE = 64 * 1024 * 1024
 
 # 识别器的种类
-RECOGNIZER_TYPE = {'image': 0, 'vidio': 1, 'camera': 2}
+RECOGNIZER_TYPE = {'image': 0, 'vidio': 1, 'camera': 2, 'multi': 3}
 
 # 表情的标签划分
 EMOTION_LABELS = {
@@ -103,15 +204,15 @@ EMOTION_MICRO_LABELS = {
     (4, 5, 6): '矛盾({0}/{1}/{2} {3}%)',
 }
 
-# 表情映射表
+# 表情映射表，对单个概率或一列概率数组都适用，取整由调用方完成
 EMOTION_MAP = (
-    lambda x: round(-23 * x**3 - 65 * x**2 + 188 * x),
-    lambda x: round(100 * x**0.3),
-    lambda x: round(100 * x**0.3),
-    lambda x: round(162 * x**3 - 105 * x**2 + 43 * x),
-    lambda x: round(100 * x**0.3),
-    lambda x: round(179 * x**3 - 400 * x**2 + 321 * x),
-    lambda x: round(100 * x**0.5),
+    lambda x: -23 * x**3 - 65 * x**2 + 188 * x,
+    lambda x: 100 * x**0.3,
+    lambda x: 100 * x**0.3,
+    lambda x: 162 * x**3 - 105 * x**2 + 43 * x,
+    lambda x: 100 * x**0.3,
+    lambda x: 179 * x**3 - 400 * x**2 + 321 * x,
+    lambda x: 100 * x**0.5,
 )
 
 
@@ -131,9 +232,47 @@ class Result(Enum):
     FACE_FOUND_MULTIPLE = '检测到 {0} 张人脸，识别结果为：\n'
 
 
-# 图像路径
-PATH_ORIGIN = 'temp/origin.png'
+# 导出图像的默认路径，界面显示不再经过磁盘
 PATH_RESULT = 'temp/result.png'
 
+# 耗时统计的默认导出路径
+PATH_STATS = 'temp/stats.json'
+
 # 字体路径
-FONT = ImageFont.truetype('temp/msyh.ttc', 24)
+PATH_FONT = 'temp/msyh.ttc'
+FONT_SIZE = 24
+
+# 标记的颜色（BGR格式）和文字图块的缓存数量
+TEXT_COLOR = (0, 0, 255)
+GLYPH_CACHE_SIZE = 256
+
+
+# 模型和字体不在导入时载入，而是由 Models.load 在后台线程中载入并预热
+class Models():
+    face: CascadeClassifier
+    emotion: EmotionBackend
+    emotion_size: tuple[int, int]
+    font: FreeTypeFont
+    ready = False
+    steps = 4  # 载入过程的步骤数，用于汇报进度
+
+    # 依次载入模型和字体，每完成一步调用一次 progress(已完成步骤, 提示文本)
+    @classmethod
+    def load(cls, progress: Callable[[int, str], None] = lambda *_: None):
+        if cls.ready:
+            return
+        progress(0, '正在载入人脸模型...')
+        cls.face = CascadeClassifier(MODEL_FACE)
+        progress(1, '正在载入表情模型...')
+        cls.emotion = loadBackend(EMOTION_BACKEND, MODEL_EMOTION,
+                                  MODEL_EMOTION_ONNX)
+        cls.emotion_size = cls.emotion.input_shape[1:3]
+        progress(2, '正在载入字体...')
+        cls.font = ImageFont.truetype(PATH_FONT, FONT_SIZE)
+
+        # 预热推理，避免第一帧承担计算图构建的开销
+        progress(3, '正在预热模型...')
+        cls.emotion.predict(
+            np.zeros((1, *cls.emotion.input_shape[1:]), np.float32))
+        cls.ready = True
+        progress(4, Result.PREPARE.value)
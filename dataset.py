@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+# 基于机器视觉的人脸表情识别系统设计-汪哲文毕业设计
+#
+# dataset.py
+# 本文件为表现层，提供构建训练数据集的命令行入口
+# 从按表情分目录存放的图像或 FER2013 的 CSV 文件中裁剪人脸，写入 models/facestore.py 的分块存储
+# 图像的解码和人脸检测在进程池中并行进行
+#
+# python dataset.py <输出目录> <图像目录或 CSV>... [--append] [-j 进程数] [--chunk 每块样本数]
+#
+# 图像目录下每个子目录为一类表情，子目录名可以是序号 0-6、中文标签或 FER2013 的英文名
+#
+# initWorker
+# 进程池的初始化函数，限制每个进程的线程数并载入人脸检测模型
+#
+# labelIndex
+# 将子目录名转为表情的序号
+#
+# listFolder
+# 列出图像目录中所有带标签的图像
+#
+# cropImage
+# 读取一张图像并裁剪出其中最大的人脸
+#
+# readCSV
+# 逐行读取 FER2013 的 CSV 文件
+#
+# 最后更新时间 2026/10/18
+
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from backend import INPUT_SHAPE
+from data import Models, MODEL_FACE, EMOTION_LABELS
+from models.facestore import FaceStoreWriter
+from visualmodule import Recognizer
+
+# 支持的图像格式
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# FER2013 各类表情的英文名，顺序与 EMOTION_LABELS 一致
+FER2013_NAMES = ('angry', 'disgust', 'fear', 'happy', 'sad', 'surprise',
+                 'neutral')
+
+
+# 进程池的初始化函数，限制每个进程的线程数并载入人脸检测模型
+# 只需要人脸检测，不载入表情模型，进程启动时不必导入 TensorFlow
+def initWorker() -> None:
+    cv2.setNumThreads(1)
+    Models.face = cv2.CascadeClassifier(MODEL_FACE)
+    Models.emotion_size = INPUT_SHAPE[1:3]
+
+
+# 将子目录名转为表情的序号，无法识别时返回 None
+def labelIndex(name: str) -> int | None:
+    name = name.strip().lower()
+    if name.isdigit() and int(name) in EMOTION_LABELS:
+        return int(name)
+    for index, label in EMOTION_LABELS.items():
+        if name == label:
+            return index
+    for index, label in enumerate(FER2013_NAMES):
+        if name.startswith(label[:4]):  # 兼容 surprised、angry 等写法
+            return index
+    return None
+
+
+# 列出图像目录中所有带标签的图像，返回 [(路径, 序号)]
+def listFolder(root: str) -> list[tuple[str, int]]:
+    items = []
+    for entry in sorted(os.scandir(root), key=lambda e: e.name):
+        if not entry.is_dir():
+            continue
+        label = labelIndex(entry.name)
+        if label is None:
+            print(f'跳过无法识别表情的目录 {entry.path}', file=sys.stderr)
+            continue
+        for folder, _, files in os.walk(entry.path):
+            items.extend((os.path.join(folder, name), label)
+                         for name in sorted(files)
+                         if os.path.splitext(name)[1].lower() in IMAGE_EXTS)
+    return items
+
+
+# 读取一张图像并裁剪出其中最大的人脸，缩放到表情模型的输入尺寸
+# 返回 (人脸图像, 序号, 错误信息)，没有检测到人脸时人脸图像为 None
+def cropImage(item: tuple[str, int]) -> tuple[np.ndarray | None, int, str]:
+    path, label = item
+    try:
+        image = cv2.imdecode(np.fromfile(path, dtype=np.uint8),
+                             cv2.IMREAD_GRAYSCALE)
+    except (OSError, cv2.error) as e:  # 文件无法读取，或内容为空、损坏
+        return None, label, str(e)
+    if image is None:
+        return None, label, '无法解码图像'
+    faces = Recognizer.getFace(image)
+    if len(faces) == 0:
+        return None, label, '没有检测到人脸'
+    _, crops = Recognizer.cropFace(image, [max(faces, key=lambda f: f[2])])
+    if len(crops) == 0:
+        return None, label, '人脸超出图像范围'
+    return crops[0], label, ''
+
+
+# 逐行读取 FER2013 的 CSV 文件，usage 不为空时只读取对应的部分
+# FER2013 的图像已经是对齐的 48*48 人脸，不再检测，尺寸不同时直接缩放
+def readCSV(path: str, usage: str | None):
+    size = INPUT_SHAPE[1:3]
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            if usage and row.get('Usage') != usage:
+                continue
+            face = np.array(row['pixels'].split(), np.uint8).reshape(48, 48)
+            if face.shape != size:
+                face = cv2.resize(face, size, interpolation=cv2.INTER_AREA)
+            yield face, int(row['emotion'])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='构建表情识别的训练数据集')
+    parser.add_argument('output', help='数据集的输出目录')
+    parser.add_argument('sources', nargs='+',
+                        help='按表情分目录的图像目录，或 FER2013 的 CSV 文件')
+    parser.add_argument('--append', action='store_true',
+                        help='追加到已有的数据集，默认覆盖')
+    parser.add_argument('--usage', help='只读取 CSV 中 Usage 为该值的行，如 Training')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='进程数，默认为 CPU 核心数')
+    parser.add_argument('--chunk', type=int, default=4096, help='每块的样本数')
+    args = parser.parse_args()
+
+    shape = (*INPUT_SHAPE[1:3], 1)
+    begin = time.time()
+    counts = np.zeros(len(EMOTION_LABELS), int)
+    skipped = 0
+    with FaceStoreWriter(args.output, shape, len(EMOTION_LABELS), args.chunk,
+                         args.append) as writer:
+        items = []
+        for source in args.sources:
+            if source.lower().endswith('.csv'):
+                for face, label in readCSV(source, args.usage):
+                    writer.add(face, label)
+                    counts[label] += 1
+            else:
+                items.extend(listFolder(source))
+
+        # 按顺序取回结果，同样的输入得到同样的数据集
+        with multiprocessing.Pool(args.jobs, initWorker) as pool:
+            for i, (face, label, error) in enumerate(
+                    pool.imap(cropImage, items, chunksize=16), 1):
+                if face is None:
+                    skipped += 1
+                    print(f'跳过 {items[i - 1][0]}：{error}', file=sys.stderr)
+                else:
+                    writer.add(face, label)
+                    counts[label] += 1
+                if i % 1000 == 0:
+                    print(f'[{i}/{len(items)}]', file=sys.stderr)
+
+    print(f'写入 {writer.count} 张人脸，跳过 {skipped} 张图像，'
+          f'用时 {time.time() - begin:.1f} 秒', file=sys.stderr)
+    for index, label in EMOTION_LABELS.items():
+        print(f'{label} {counts[index]}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
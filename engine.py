@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+# 基于机器视觉的人脸表情识别系统设计-汪哲文毕业设计
+#
+# engine.py
+# 本文件为数据层，用 NumPy 直接实现 mini_XCEPTION 的前向计算
+# 只读取 HDF5 中的网络结构和权重，不需要导入 TensorFlow，启动快、占用内存少
+#
+# NumpyEngine
+# 按 Keras 保存的网络结构依次执行各层，批量推理
+#
+# load
+# 读取网络结构和权重，把 BatchNormalization 合并到前面的卷积层中
+#
+# fold
+# 计算 BatchNormalization 合并到卷积后的权重和偏置
+#
+# predict
+# 批量推理，输入输出与 Keras 模型一致
+#
+# pad / conv / depthwise / maxPool
+# 各层的计算，卷积通过拼接平移后的切片转为一次矩阵乘法
+#
+# 最后更新时间 2026/10/18
+
+import json
+from math import ceil
+
+import h5py
+import numpy as np
+
+
+# 按 Keras 的规则补齐边缘，same 时输出尺寸为 ceil(输入 / 步长)
+def pad(x: np.ndarray,
+        kernel: tuple,
+        strides: tuple,
+        padding: str,
+        value: float = 0.0) -> np.ndarray:
+    if padding == 'valid':
+        return x
+    widths = [(0, 0)]
+    for size, k, s in zip(x.shape[1:3], kernel, strides):
+        total = max((ceil(size / s) - 1) * s + k - size, 0)
+        widths.append((total // 2, total - total // 2))
+    widths.append((0, 0))
+    if not any(sum(w) for w in widths):
+        return x
+    return np.pad(x, widths, constant_values=value)
+
+
+# 卷积核每个位置对应的输入切片，x 为补齐后的 NHWC 张量
+def windows(x: np.ndarray, kernel: tuple, strides: tuple):
+    (kh, kw), (sh, sw) = kernel, strides
+    h = (x.shape[1] - kh) // sh + 1
+    w = (x.shape[2] - kw) // sw + 1
+    for i in range(kh):
+        for j in range(kw):
+            yield i, j, x[:, i:i + (h - 1) * sh + 1:sh,
+                          j:j + (w - 1) * sw + 1:sw]
+
+
+# 普通卷积，把 kh*kw 个平移后的切片沿通道拼接，再与展开的卷积核做一次矩阵乘法
+def conv(x: np.ndarray, kernel: np.ndarray, bias: np.ndarray | None,
+         strides: tuple) -> np.ndarray:
+    kh, kw, c, o = kernel.shape
+    if kh == kw == 1:
+        cols = x[:, ::strides[0], ::strides[1]]
+    else:
+        cols = np.concatenate(
+            [s for *_, s in windows(x, (kh, kw), strides)], axis=3)
+    y = cols @ kernel.reshape(kh * kw * c, o)
+    if bias is not None:
+        y += bias
+    return y
+
+
+# 逐通道卷积，每个位置的切片乘以对应的权重后累加，乘积写入复用的缓冲区
+# 步长为 1 时每行的宽和通道在内存中连续，把权重沿宽度平铺后按行计算，避免通道数少时循环过短
+def depthwise(x: np.ndarray, kernel: np.ndarray, strides: tuple) -> np.ndarray:
+    kh, kw, c, m = kernel.shape
+    if m > 1:
+        x = np.repeat(x, m, axis=3)  # 输出通道顺序为 c * m + k，与 Keras 一致
+    kernel = kernel.reshape(kh, kw, c * m)
+    y = term = None
+    for i, j, s in windows(x, (kh, kw), strides):
+        n, h, w, d = s.shape
+        if strides == (1, 1):
+            s = s.reshape(n, h, w * d)
+            k = np.tile(kernel[i, j], w)
+        else:
+            k = kernel[i, j]
+        if y is None:
+            y = s * k
+            term = np.empty_like(y)
+        else:
+            np.multiply(s, k, out=term)
+            y += term
+    return y.reshape(n, h, w, d)  # type: ignore
+
+
+# 最大池化，补齐的边缘填充 -inf，不影响最大值
+def maxPool(x: np.ndarray, pool: tuple, strides: tuple,
+            padding: str) -> np.ndarray:
+    x = pad(x, pool, strides, padding, -np.inf)
+    y = None
+    for *_, s in windows(x, pool, strides):
+        if y is None:
+            y = s.copy()
+        else:
+            np.maximum(y, s, out=y)
+    return y  # type: ignore
+
+
+def activate(x: np.ndarray, name: str) -> np.ndarray:
+    if name == 'linear':
+        return x
+    if name == 'relu':
+        return np.maximum(x, 0, out=x)
+    if name == 'softmax':
+        x = np.exp(x - x.max(axis=-1, keepdims=True))
+        return x / x.sum(axis=-1, keepdims=True)
+    raise ValueError(f'不支持的激活函数 {name}')
+
+
+# 用 NumPy 实现的 mini_XCEPTION 推理引擎
+# 支持 models/cnn.py 用到的全部层，遇到其他层时报错而不是给出错误的结果
+class NumpyEngine():
+
+    def __init__(self, path: str) -> None:
+        self.layers = []  # [(类型, 名称, 输入名称, 参数)]，按计算顺序排列
+        self.input_shape = (None, )
+        self.input = ''
+        self.output = ''
+        self.load(path)
+
+    # 读取网络结构和权重，把 BatchNormalization 合并到前面的卷积层中
+    def load(self, path: str) -> None:
+        with h5py.File(path, 'r') as f:
+            config = json.loads(f.attrs['model_config'])['config']
+            group = f['model_weights']
+            weights = {}
+            for layer in config['layers']:
+                name = layer['config']['name']
+                if name in group:
+                    item = group[name]
+                    weights[name] = {
+                        w.split('/')[-1].split(':')[0]: np.asarray(
+                            item[w], np.float64)  # type: ignore
+                        for w in item.attrs['weight_names']  # type: ignore
+                    }
+
+        # 各层的输出被多少层使用，只有唯一使用者是 BatchNormalization 的卷积才能合并
+        consumers = {}
+        for layer in config['layers']:
+            for node in layer['inbound_nodes']:
+                for inbound in node:
+                    consumers[inbound[0]] = consumers.get(inbound[0], 0) + 1
+
+        alias = {}  # 被合并的层的名称 -> 实际计算它的层
+        index = {}  # 层名称 -> 在 self.layers 中的位置
+        for layer in config['layers']:
+            kind, cfg = layer['class_name'], layer['config']
+            name = cfg['name']
+            inputs = [
+                alias.get(inbound[0], inbound[0])
+                for node in layer['inbound_nodes'] for inbound in node
+            ]
+            w = weights.get(name, {})
+            if kind == 'InputLayer':
+                shape = cfg.get('batch_input_shape') or cfg['batch_shape']
+                self.input_shape = (None, *shape[1:])
+                self.input = name
+                continue
+            if kind == 'BatchNormalization':
+                scale = w['gamma'] / np.sqrt(w['moving_variance'] +
+                                             cfg['epsilon'])
+                shift = w['beta'] - w['moving_mean'] * scale
+                source = inputs[0]
+                if (source in index and consumers.get(source) == 1 and
+                        self.layers[index[source]][0] in ('conv',
+                                                          'separable')):
+                    self.fold(index[source], scale, shift)
+                    alias[name] = source
+                else:
+                    self.layers.append(('scale', name, inputs,
+                                        (scale.astype(np.float32),
+                                         shift.astype(np.float32))))
+                    index[name] = len(self.layers) - 1
+                continue
+
+            if kind == 'Conv2D':
+                params = {
+                    'kernel': w['kernel'],
+                    'bias': w.get('bias'),
+                    'strides': tuple(cfg['strides']),
+                    'padding': cfg['padding'],
+                    'activation': cfg['activation'],
+                }
+                self.layers.append(('conv', name, inputs, params))
+            elif kind == 'SeparableConv2D':
+                params = {
+                    'depthwise': w['depthwise_kernel'].astype(np.float32),
+                    'kernel': w['pointwise_kernel'],
+                    'bias': w.get('bias'),
+                    'strides': tuple(cfg['strides']),
+                    'padding': cfg['padding'],
+                    'activation': cfg['activation'],
+                }
+                self.layers.append(('separable', name, inputs, params))
+            elif kind == 'Activation':
+                self.layers.append(('activation', name, inputs,
+                                    cfg['activation']))
+            elif kind == 'MaxPooling2D':
+                self.layers.append(
+                    ('maxpool', name, inputs,
+                     (tuple(cfg['pool_size']), tuple(cfg['strides']),
+                      cfg['padding'])))
+            elif kind == 'Add':
+                self.layers.append(('add', name, inputs, None))
+            elif kind == 'GlobalAveragePooling2D':
+                self.layers.append(('gap', name, inputs, None))
+            else:
+                raise ValueError(f'NumPy 推理引擎不支持 {kind} 层 {name}')
+            index[name] = len(self.layers) - 1
+
+        output = config['output_layers'][0][0]
+        self.output = alias.get(output, output)
+
+        # 权重统一转为 float32，卷积核保持连续以加快矩阵乘法
+        for kind, _, _, params in self.layers:
+            if kind in ('conv', 'separable'):
+                params['kernel'] = np.ascontiguousarray(params['kernel'],
+                                                        np.float32)
+                if params['bias'] is not None:
+                    params['bias'] = params['bias'].astype(np.float32)
+
+        # 每个中间结果最后一次被使用的位置，用完即释放
+        self.last = {}
+        for i, (_, _, inputs, _) in enumerate(self.layers):
+            for name in inputs:
+                self.last[name] = i
+
+    # 把 BatchNormalization 的缩放和平移合并到卷积核的输出通道和偏置中
+    # 可分离卷积只需合并到逐点卷积上
+    def fold(self, position: int, scale: np.ndarray,
+             shift: np.ndarray) -> None:
+        params = self.layers[position][3]
+        if params['activation'] != 'linear':
+            raise ValueError('卷积带有激活函数时不能合并 BatchNormalization')
+        bias = params['bias']
+        params['kernel'] = params['kernel'] * scale
+        params['bias'] = shift if bias is None else bias * scale + shift
+
+    # 批量推理，输入 N*48*48*1 的 float32 张量，返回 N*7 的表情概率
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        # 复制一份输入，原地计算时不会改动调用方的数据
+        tensors = {self.input: np.array(x, np.float32)}
+        for i, (kind, name, inputs, params) in enumerate(self.layers):
+            args = [tensors[n] for n in inputs]
+            if kind == 'conv':
+                k = params['kernel'].shape[:2]
+                y = conv(pad(args[0], k, params['strides'], params['padding']),
+                         params['kernel'], params['bias'], params['strides'])
+                y = activate(y, params['activation'])
+            elif kind == 'separable':
+                k = params['depthwise'].shape[:2]
+                y = depthwise(
+                    pad(args[0], k, params['strides'], params['padding']),
+                    params['depthwise'], params['strides'])
+                y = y @ params['kernel']
+                if params['bias'] is not None:
+                    y += params['bias']
+                y = activate(y, params['activation'])
+            elif kind == 'scale':
+                y = args[0] * params[0] + params[1]
+            elif kind == 'activation':
+                # 输入只被本层使用时原地计算
+                y = args[0] if self.last.get(inputs[0]) == i else args[0].copy()
+                y = activate(y, params)
+            elif kind == 'maxpool':
+                y = maxPool(args[0], *params)
+            elif kind == 'add':
+                y = args[0] + args[1]
+                for other in args[2:]:
+                    y += other
+            else:  # gap
+                y = args[0].mean(axis=(1, 2))
+            tensors[name] = y
+            for n in inputs:
+                if self.last.get(n) == i:
+                    tensors.pop(n, None)
+        return tensors[self.output]
@@ -5,7 +5,7 @@
 # framework.py
 # 本文件为数据层，设计了三种识别器的框架，并提供了静态类型检查
 #
-# 最后更新时间 2024/04/15
+# 最后更新时间 2026/10/18
 
 from abc import ABC, abstractmethod
 from PyQt5.QtWidgets import QLabel, QPushButton, QFrame, QRadioButton
@@ -48,5 +48,6 @@ class Ui_Type_Check():
     rImage: QRadioButton
     rVidio: QRadioButton
     rCamera: QRadioButton
+    rMulti: QRadioButton
     lImage: QLabel
     lData: QLabel
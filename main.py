@@ -8,7 +8,7 @@
 # Window
 # 在ui框架的基础上，连接信号和槽，完成数据传输
 #
-# 最后更新时间 2024/04/15
+# 最后更新时间 2026/10/18
 
 import sys
 from PyQt5 import QtCore, QtGui, QtWidgets
@@ -31,7 +31,29 @@ class Window(QtWidgets.QMainWindow, Ui_Form, Ui_Type_Check):
         self.rImage.clicked.connect(lambda: controller.radio_set('image'))
         self.rVidio.clicked.connect(lambda: controller.radio_set('vidio'))
         self.rCamera.clicked.connect(lambda: controller.radio_set('camera'))
-        self.lImage.mousePressEvent = (lambda *_: controller.loadImg())
+        self.rMulti.clicked.connect(lambda: controller.radio_set('multi'))
+        self.lImage.mousePressEvent = self.imageClicked
+
+    # 关闭窗口前停止后台线程
+    def closeEvent(self, event: QtGui.QCloseEvent):
+        controller.close()
+        super().closeEvent(event)
+
+    # F3 开启或关闭耗时统计的叠加显示，F4 导出耗时统计
+    def keyPressEvent(self, event: QtGui.QKeyEvent):
+        if event.key() == QtCore.Qt.Key.Key_F3:
+            controller.setStats(not controller.overlay)
+        elif event.key() == QtCore.Qt.Key.Key_F4:
+            controller.dumpStats()
+        else:
+            super().keyPressEvent(event)
+
+    # 左键单击图像框载入图像，右键单击导出当前图像
+    def imageClicked(self, event: QtGui.QMouseEvent):
+        if event.button() == QtCore.Qt.MouseButton.RightButton:
+            controller.exportImg()
+        else:
+            controller.loadImg()
 
 
 #运行窗口 root
@@ -0,0 +1,123 @@
+# 分块存储的人脸数据集，由 dataset.py 生成，供 train.py 等训练脚本读取
+#
+# 目录结构：
+#   meta.json        图像尺寸、类别数和各块的文件名与样本数
+#   X-00000.npy      uint8 的人脸图像，N*48*48*1
+#   Y-00000.npy      uint8 的类别序号，N
+#
+# 每块都是普通的 .npy 文件，读取时以内存映射的方式打开，不会把整个数据集读入内存
+# 追加新的数据只需写入新的块，已有的块保持不变
+
+import json
+import os
+
+import numpy as np
+
+
+# 判断路径是否为分块存储的数据集
+def is_store(path):
+    return os.path.isfile(os.path.join(path, 'meta.json'))
+
+
+# 以内存映射的方式打开的数据集
+class FaceStore():
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.shape = tuple(meta['shape'])
+        self.num_classes = meta['num_classes']
+        self.X = [
+            np.load(os.path.join(path, chunk['x']), mmap_mode='r')
+            for chunk in meta['chunks']
+        ]
+        self.Y = [
+            np.load(os.path.join(path, chunk['y']), mmap_mode='r')
+            for chunk in meta['chunks']
+        ]
+        # 每块第一个样本的全局序号
+        self.offsets = np.cumsum([0] + [len(y) for y in self.Y])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    # 全部样本的类别序号，只有 N 个字节，直接读入内存
+    def labels(self):
+        if len(self.Y) == 0:
+            return np.zeros(0, np.uint8)
+        return np.concatenate(self.Y)
+
+    # 类别序号转为 train.py 使用的 one-hot 标签
+    def onehot(self, y):
+        return np.eye(self.num_classes, dtype=np.float32)[y]
+
+
+# 分块写入数据集，append 为真时在已有的数据集后追加
+class FaceStoreWriter():
+
+    def __init__(self, path, shape, num_classes, chunk_size=4096,
+                 append=False):
+        self.path = path
+        self.chunk_size = chunk_size
+        os.makedirs(path, exist_ok=True)
+        if append and is_store(path):
+            with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+                self.meta = json.load(f)
+            if (tuple(self.meta['shape']) != tuple(shape)
+                    or self.meta['num_classes'] != num_classes):
+                raise ValueError(f'{path} 中已有数据集的图像尺寸或类别数不同')
+        else:
+            if is_store(path):
+                # 覆盖已有的数据集时删除旧的块
+                for name in os.listdir(path):
+                    if name.endswith('.npy'):
+                        os.remove(os.path.join(path, name))
+            self.meta = {
+                'shape': list(shape),
+                'num_classes': num_classes,
+                'chunks': []
+            }
+            self.save_meta()
+        self.faces, self.labels = [], []
+        self.count = 0  # 本次写入的样本数
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, face, label):
+        self.faces.append(face)
+        self.labels.append(label)
+        if len(self.faces) >= self.chunk_size:
+            self.flush()
+
+    # 将缓冲的样本写为新的一块，最后更新 meta.json，中途中断不会留下不完整的块记录
+    def flush(self):
+        if len(self.faces) == 0:
+            return
+        index = len(self.meta['chunks'])
+        while os.path.exists(os.path.join(self.path, f'X-{index:05d}.npy')):
+            index += 1
+        chunk = {'x': f'X-{index:05d}.npy', 'y': f'Y-{index:05d}.npy'}
+        x = np.stack(self.faces).astype(np.uint8).reshape(
+            -1, *self.meta['shape'])
+        np.save(os.path.join(self.path, chunk['x']), x)
+        np.save(os.path.join(self.path, chunk['y']),
+                np.asarray(self.labels, np.uint8))
+        chunk['count'] = len(x)
+        self.meta['chunks'].append(chunk)
+        self.save_meta()
+        self.count += len(x)
+        self.faces, self.labels = [], []
+
+    def save_meta(self):
+        path = os.path.join(self.path, 'meta.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def close(self):
+        self.flush()
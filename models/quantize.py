@@ -0,0 +1,149 @@
+# 将表情识别模型转换为 float16 和 INT8 量化的 TensorFlow Lite 模型
+# 并在 train.py 相同划分的验证集上比较各版本的准确率和每张人脸的推理耗时
+#
+# python models/quantize.py [--model 模型.hdf5] [--data models/Data.hdf5] [--calibration 500]
+#
+# 生成的模型与原模型放在同一目录，扩展名为 .float16.tflite 和 .int8.tflite
+# 在 data.py 中将 EMOTION_BACKEND 设为 tflite_float16 或 tflite_int8 即可使用
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import h5py
+import numpy as np
+import tensorflow as tf
+from keras.models import load_model
+from sklearn.model_selection import train_test_split
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import KerasCallBackend, TFLiteBackend
+from facestore import FaceStore, is_store
+
+
+def uint2float(x):
+    x = x.astype('float32')
+    x = x / 255.0
+    x = x - 0.5
+    x = x * 2.0
+    return x
+
+
+# parameters
+
+model_path = 'models/model_emotion/fer2013_mini_XCEPTION.95-0.70.hdf5'
+data_path = 'models/Data.hdf5'
+validation_split = 0.1  # 与 train.py 相同，保证验证集没有参与训练和校准
+calibration_size = 500
+latency_batches = (1, 32)
+latency_repeat = 20
+
+
+# 读取数据集并按 train.py 的方式划分训练集和验证集
+# path 可以是 HDF5 文件，也可以是 dataset.py 生成的数据集目录
+def load_data(path):
+    if is_store(path):
+        store = FaceStore(path)
+        X = np.concatenate(store.X)
+        Y = store.onehot(store.labels())
+    else:
+        with h5py.File(path, 'r') as f:
+            X = f['X'][()]  # type: ignore
+            Y = f['Y'][()]  # type: ignore
+    if X.ndim == 3:
+        X = X[..., np.newaxis]
+    X = uint2float(X)
+    return train_test_split(X, Y, test_size=validation_split, random_state=0)
+
+
+# 转换为 TensorFlow Lite 模型，kind 为 float16 或 int8
+# INT8 模型用训练集中随机抽取的样本校准激活值的范围，输入输出仍为 float32
+def convert(model, kind, calibration):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if kind == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+
+        def representative_dataset():
+            for x in calibration:
+                yield [x[np.newaxis]]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8
+        ]
+    return converter.convert()
+
+
+# 在验证集上计算 top-1 准确率
+def accuracy(backend, X, Y, batch_size=256):
+    predictions = np.concatenate([
+        backend.predict(X[i:i + batch_size])
+        for i in range(0, len(X), batch_size)
+    ])
+    return float(np.mean(predictions.argmax(1) == Y.argmax(1)))
+
+
+# 每张人脸的平均推理耗时（毫秒）
+def latency(backend, X, batch_size):
+    x = X[:batch_size]
+    backend.predict(x)  # 预热
+    begin = time.perf_counter()
+    for _ in range(latency_repeat):
+        backend.predict(x)
+    return (time.perf_counter() - begin) * 1000 / latency_repeat / len(x)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='表情识别模型量化')
+    parser.add_argument('--model', default=model_path)
+    parser.add_argument('--data', default=data_path)
+    parser.add_argument('--calibration', type=int, default=calibration_size,
+                        help='INT8 校准使用的样本数')
+    parser.add_argument('--report', help='报告的保存路径，默认与模型同名的 .quantize.json')
+    args = parser.parse_args()
+
+    train_X, test_X, _, test_Y = load_data(args.data)
+    rng = np.random.default_rng(0)
+    calibration = train_X[rng.choice(len(train_X),
+                                     min(args.calibration, len(train_X)),
+                                     replace=False)]
+
+    model = load_model(args.model, compile=False)
+    stem = os.path.splitext(args.model)[0]
+    variants = {'float32': (KerasCallBackend(args.model), args.model)}
+    for kind in ('float16', 'int8'):
+        path = f'{stem}.{kind}.tflite'
+        with open(path, 'wb') as f:
+            f.write(convert(model, kind, calibration))
+        print(f'已生成 {path}')
+        variants[kind] = (TFLiteBackend(path), path)
+
+    # 准确率和耗时的对比
+    report = []
+    for kind, (backend, path) in variants.items():
+        row = {
+            'model': kind,
+            'size_kb': round(os.path.getsize(path) / 1024, 1),
+            'accuracy': round(accuracy(backend, test_X, test_Y), 4),
+        }
+        for batch in latency_batches:
+            row[f'ms_per_face_batch{batch}'] = round(
+                latency(backend, test_X, batch), 4)
+        report.append(row)
+
+    print(f'验证集 {len(test_X)} 张，校准 {len(calibration)} 张')
+    print(' '.join(f'{k:>22}' for k in report[0]))
+    for row in report:
+        print(' '.join(f'{v:>22}' for v in row.values()))
+    path = args.report or stem + '.quantize.json'
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'报告已保存到 {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+# k 折交叉验证和超参数搜索，每组参数的每一折在单独的进程中训练，结果汇总为一张表
+#
+# python models/sweep.py [--data models/Data.hdf5] [--folds 5] [--l2 0.01 0.001]
+#                        [--batch 32 64] [--schedule plateau cosine] [-j 进程数] [--threads 每个进程的线程数]
+#
+# --folds 为 0 时不做交叉验证，按 train.py 的方式划分一次训练集和验证集
+# 每个进程的线程数默认为 CPU 核心数除以进程数，避免多个 TensorFlow 进程争抢核心
+# 每次训练的日志和最好的模型保存在 --output 目录中，汇总结果保存为其中的 summary.csv
+
+import argparse
+import csv
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import itertools
+import multiprocessing
+import os
+import time
+
+import h5py
+import numpy as np
+from sklearn.model_selection import KFold
+from sklearn.model_selection import train_test_split
+
+from facestore import FaceStore, is_store
+
+# 子进程中的线程数，由 init_worker 设置
+THREADS = 1
+
+
+# 进程池的初始化函数，在导入 TensorFlow 之前限制线程数
+def init_worker(threads):
+    global THREADS
+    THREADS = threads
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+
+def count_samples(path):
+    if is_store(path):
+        return len(FaceStore(path))
+    with h5py.File(path, 'r') as f:
+        return len(f['X'])  # type: ignore
+
+
+# 每一折的训练集掩码，folds 为 0 时与 train.py 的划分相同
+def split_masks(num_samples, folds, validation_split):
+    index = np.arange(num_samples)
+    if folds == 0:
+        splits = [train_test_split(index, test_size=validation_split,
+                                   random_state=0)]
+    else:
+        splits = KFold(folds, shuffle=True, random_state=0).split(index)
+    masks = []
+    for train_index, _ in splits:
+        mask = np.zeros(num_samples, bool)
+        mask[train_index] = True
+        masks.append(mask)
+    return masks
+
+
+# 在子进程中训练一次，返回验证集上最好的结果
+def run_task(task):
+    import tensorflow as tf
+    from keras.callbacks import CSVLogger, EarlyStopping, ModelCheckpoint
+    from keras.callbacks import LearningRateScheduler, ReduceLROnPlateau
+    from keras.optimizers import Adam
+
+    import train
+    from cnn import mini_XCEPTION
+
+    tf.config.threading.set_intra_op_parallelism_threads(THREADS)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    options = tf.data.Options()
+    options.threading.private_threadpool_size = THREADS
+
+    mask = task['mask']
+    train_data = train.make_dataset(task['data'], mask, True,
+                                    task['batch']).with_options(options)
+    test_data = train.make_dataset(task['data'], ~mask, False,
+                                   task['batch']).with_options(options)
+
+    model = mini_XCEPTION(train.input_shape, train.num_classes,
+                          l2_regularization=task['l2'])
+    model.compile(optimizer=Adam(task['lr']),
+                  loss='categorical_crossentropy',
+                  metrics=['accuracy'])
+
+    name = os.path.join(task['output'], f'run{task["run"]:03d}_fold{task["fold"]}')
+    patience = task['patience']
+    callbacks = [
+        train.StepsPerSecond(),
+        ModelCheckpoint(name + '.hdf5', 'val_loss', save_best_only=True),
+        CSVLogger(name + '.log'),
+        EarlyStopping('val_loss', patience=patience),
+    ]
+    if task['schedule'] == 'plateau':
+        callbacks.append(
+            ReduceLROnPlateau('val_loss', factor=0.1,
+                              patience=max(patience // 4, 1)))
+    elif task['schedule'] == 'cosine':
+        epochs, lr = task['epochs'], task['lr']
+        callbacks.append(
+            LearningRateScheduler(lambda epoch: lr * 0.5 * (1 + np.cos(
+                np.pi * epoch / epochs))))
+
+    begin = time.time()
+    history = model.fit(train_data,
+                        steps_per_epoch=int(np.ceil(mask.sum() /
+                                                    task['batch'])),
+                        epochs=task['epochs'],
+                        verbose=0,
+                        callbacks=callbacks,
+                        validation_data=test_data).history
+    best = int(np.argmin(history['val_loss']))
+    return {
+        'run': task['run'],
+        'fold': task['fold'],
+        'l2': task['l2'],
+        'batch': task['batch'],
+        'schedule': task['schedule'],
+        'lr': task['lr'],
+        'epochs': len(history['val_loss']),
+        'best_epoch': best + 1,
+        'val_loss': round(float(history['val_loss'][best]), 4),
+        'val_accuracy': round(float(history['val_accuracy'][best]), 4),
+        'steps_per_sec': round(float(np.mean(history['steps_per_sec'])), 2),
+        'seconds': round(time.time() - begin, 1),
+    }
+
+
+# 按参数组合汇总各折的结果，按验证集准确率从高到低排列
+def summarize(results):
+    groups = {}
+    for r in results:
+        groups.setdefault((r['l2'], r['batch'], r['schedule'], r['lr']),
+                          []).append(r)
+    rows = []
+    for (l2, batch, schedule, lr), items in groups.items():
+        accuracy = np.array([r['val_accuracy'] for r in items])
+        loss = np.array([r['val_loss'] for r in items])
+        rows.append({
+            'l2': l2,
+            'batch': batch,
+            'schedule': schedule,
+            'lr': lr,
+            'folds': len(items),
+            'val_accuracy': round(float(accuracy.mean()), 4),
+            'val_accuracy_std': round(float(accuracy.std()), 4),
+            'val_loss': round(float(loss.mean()), 4),
+            'epochs': round(float(np.mean([r['epochs'] for r in items])), 1),
+            'minutes': round(sum(r['seconds'] for r in items) / 60, 1),
+        })
+    return sorted(rows, key=lambda r: -r['val_accuracy'])
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='k 折交叉验证和超参数搜索')
+    parser.add_argument('--data', default='models/Data.hdf5',
+                        help='HDF5 文件或 dataset.py 生成的数据集目录')
+    parser.add_argument('--output', default='models/sweep/')
+    parser.add_argument('--folds', type=int, default=5,
+                        help='交叉验证的折数，0 表示只划分一次')
+    parser.add_argument('--l2', type=float, nargs='+', default=[0.01])
+    parser.add_argument('--batch', type=int, nargs='+', default=[32])
+    parser.add_argument('--schedule', nargs='+', default=['plateau'],
+                        choices=['plateau', 'cosine', 'constant'],
+                        help='学习率的调整方式')
+    parser.add_argument('--lr', type=float, nargs='+', default=[0.001],
+                        help='初始学习率')
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--patience', type=int, default=10)
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='同时训练的进程数，默认为任务数和 CPU 核心数中较小的一个')
+    parser.add_argument('--threads', type=int,
+                        help='每个进程的线程数，默认为 CPU 核心数除以进程数')
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    masks = split_masks(count_samples(args.data), args.folds, 0.1)
+    grid = list(itertools.product(args.l2, args.batch, args.schedule,
+                                  args.lr))
+    tasks = [{
+        'run': run,
+        'fold': fold,
+        'l2': l2,
+        'batch': batch,
+        'schedule': schedule,
+        'lr': lr,
+        'mask': mask,
+        'data': args.data,
+        'output': args.output,
+        'epochs': args.epochs,
+        'patience': args.patience,
+    } for run, (l2, batch, schedule, lr) in enumerate(grid)
+             for fold, mask in enumerate(masks)]
+
+    cores = os.cpu_count() or 1
+    jobs = args.jobs or min(len(tasks), cores)
+    threads = args.threads or max(cores // jobs, 1)
+    print(f'{len(grid)} 组参数 x {len(masks)} 折 = {len(tasks)} 次训练，'
+          f'{jobs} 个进程，每个进程 {threads} 个线程')
+
+    # TensorFlow 不支持 fork，使用 spawn 启动子进程，每个进程只训练一次以释放内存
+    results = []
+    begin = time.time()
+    with ProcessPoolExecutor(jobs,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_worker,
+                             initargs=(threads, ),
+                             max_tasks_per_child=1) as pool:
+        futures = [pool.submit(run_task, task) for task in tasks]
+        for future in as_completed(futures):
+            r = future.result()
+            results.append(r)
+            print(f'[{len(results)}/{len(tasks)}] run{r["run"]:03d} '
+                  f'fold{r["fold"]} val_accuracy {r["val_accuracy"]} '
+                  f'({r["seconds"]} s)')
+
+    results.sort(key=lambda r: (r['run'], r['fold']))
+    write_csv(os.path.join(args.output, 'runs.csv'), results)
+    summary = summarize(results)
+    write_csv(os.path.join(args.output, 'summary.csv'), summary)
+
+    print(f'总用时 {(time.time() - begin) / 60:.1f} 分钟')
+    print(' '.join(f'{k:>16}' for k in summary[0]))
+    for row in summary:
+        print(' '.join(f'{v:>16}' for v in row.values()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,14 @@
 from keras.callbacks import CSVLogger, ModelCheckpoint, EarlyStopping
-from keras.callbacks import ReduceLROnPlateau
-from keras.preprocessing.image import ImageDataGenerator
+from keras.callbacks import Callback, ReduceLROnPlateau
 
 from cnn import mini_XCEPTION
+from facestore import FaceStore, is_store
+import math
+import time
 import numpy as np
 import h5py
 import sklearn
+import tensorflow as tf
 from sklearn.model_selection import KFold
 from sklearn.model_selection import train_test_split
 
@@ -18,6 +21,123 @@ def uint2float(x):
     return x
 
 
+# 依次读取数据集的各块，返回 (块的起始序号, 图像, 标签)
+# data_path 为 dataset.py 生成的分块存储时以内存映射的方式读取，为 HDF5 文件时按 chunk_size 切片读取
+# shuffle 为真时每轮以随机顺序读取各块，块内的顺序由后面的 shuffle 缓冲区打乱
+def iter_chunks(path, shuffle):
+    if is_store(path):
+        store = FaceStore(path)
+        order = np.arange(len(store.X))
+        if shuffle:
+            np.random.shuffle(order)
+        for i in order:
+            yield store.offsets[i], store.X[i], store.onehot(store.Y[i])
+        return
+    with h5py.File(path, 'r') as f:
+        X, Y = f['X'], f['Y']
+        starts = np.arange(0, len(X), chunk_size)  # type: ignore
+        if shuffle:
+            np.random.shuffle(starts)
+        for start in starts:
+            yield (start, X[start:start + chunk_size],  # type: ignore
+                   Y[start:start + chunk_size])  # type: ignore
+
+
+# 按块读取属于 mask 的样本，每次只有一块数据在内存中
+def read_chunks(path, mask, shuffle):
+    def generator():
+        for start, x, y in iter_chunks(path, shuffle):
+            selected = mask[start:start + len(y)]
+            if not selected.any():
+                continue
+            x = x[selected]  # 内存映射的块只复制选中的样本
+            if x.ndim == 3:
+                x = x[..., np.newaxis]
+            yield x, y[selected]
+
+    return generator
+
+
+# 数据集的样本数、图像和标签的形状与类型
+def describe(path):
+    if is_store(path):
+        store = FaceStore(path)
+        return (len(store), store.shape, np.dtype(np.uint8),
+                (store.num_classes, ), np.dtype(np.float32))
+    with h5py.File(path, 'r') as f:
+        X, Y = f['X'], f['Y']
+        return len(X), X.shape[1:], X.dtype, Y.shape[1:], Y.dtype  # type: ignore
+
+
+# 在图执行中完成与 uint2float 相同的归一化
+def normalize(x, y):
+    x = tf.cast(x, tf.float32) / 127.5 - 1.0
+    return x, tf.cast(y, tf.float32)
+
+
+# 对一个批次做随机旋转、平移、缩放和水平翻转，参数与原先的 ImageDataGenerator 相同
+# 每张图像的变换合成一个仿射矩阵，整个批次一次插值完成
+def augment(x, y):
+    n = tf.shape(x)[0]
+    size = tf.cast(tf.shape(x)[1:3], tf.float32)
+    angle = tf.random.uniform([n], -rotation_range,
+                              rotation_range) * math.pi / 180
+    zoom = tf.random.uniform([n, 2], 1 - zoom_range, 1 + zoom_range)
+    shift = tf.random.uniform([n, 2], -shift_range, shift_range) * size[::-1]
+    flip = tf.random.uniform([n]) < 0.5
+    x = tf.where(flip[:, None, None, None], tf.reverse(x, [2]), x)
+
+    # 输出坐标到输入坐标的映射，以图像中心为原点旋转和缩放
+    cos, sin = tf.cos(angle), tf.sin(angle)
+    a0, a1 = cos * zoom[:, 0], -sin * zoom[:, 1]
+    b0, b1 = sin * zoom[:, 0], cos * zoom[:, 1]
+    cy, cx = (size[0] - 1) / 2, (size[1] - 1) / 2
+    a2 = cx - a0 * cx - a1 * cy + shift[:, 0]
+    b2 = cy - b0 * cx - b1 * cy + shift[:, 1]
+    zeros = tf.zeros([n])
+    transforms = tf.stack([a0, a1, a2, b0, b1, b2, zeros, zeros], axis=1)
+    x = tf.raw_ops.ImageProjectiveTransformV3(images=x,
+                                              transforms=transforms,
+                                              output_shape=tf.shape(x)[1:3],
+                                              fill_value=0.0,
+                                              interpolation='BILINEAR',
+                                              fill_mode='NEAREST')
+    return x, y
+
+
+# 流式读取数据集，归一化和数据增强在多个线程中并行进行，并预取下一批
+# batch 为空时使用 batch_size，sweep.py 搜索批量时会传入其他值
+def make_dataset(path, mask, training, batch=None):
+    _, x_shape, x_dtype, y_shape, y_dtype = describe(path)
+    if len(x_shape) == 2:
+        x_shape = (*x_shape, 1)
+    dataset = tf.data.Dataset.from_generator(
+        read_chunks(path, mask, training),
+        output_signature=(tf.TensorSpec((None, *x_shape), x_dtype),
+                          tf.TensorSpec((None, *y_shape), y_dtype)))
+    dataset = dataset.unbatch()
+    if training:
+        dataset = dataset.shuffle(shuffle_buffer).repeat()
+    dataset = dataset.batch(batch or batch_size)
+    dataset = dataset.map(normalize, num_parallel_calls=tf.data.AUTOTUNE)
+    if training:
+        dataset = dataset.map(augment, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+# 每轮结束时输出训练的速度（步/秒），同时写入日志
+class StepsPerSecond(Callback):
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.begin = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        speed = self.params['steps'] / (time.perf_counter() - self.begin)
+        print(f' - {speed:.1f} steps/s')
+        if logs is not None:
+            logs['steps_per_sec'] = speed
+
+
 # parameters
 
 batch_size = 32
@@ -27,57 +147,60 @@ validation_split = 0.1
 num_classes = 7
 patience = 50
 base_path = 'models/test/'
+data_path = 'models/Data.hdf5'  # 也可以是 dataset.py 生成的数据集目录
+
+# data pipeline
+chunk_size = 4096  # 每次从 HDF5 读取的样本数
+shuffle_buffer = 8192
+rotation_range = 10
+shift_range = 0.1
+zoom_range = 0.1
+
+# 作为模块导入时只提供上面的数据管道，供 sweep.py 使用
+if __name__ == '__main__':
+    # model parameters/compilation
+    model = mini_XCEPTION(input_shape, num_classes)
+    model.compile(optimizer='adam',
+                  loss='categorical_crossentropy',
+                  metrics=['accuracy'])
+    model.summary()
+
+    datasets = ['fer2013']
+
+    for dataset_name in datasets:
+        print('Training dataset:', dataset_name)
+        # callbacks
+        log_file_path = base_path + dataset_name + '_emotion_training.log'
+        csv_logger = CSVLogger(log_file_path, append=False)
+        early_stop = EarlyStopping('val_loss', patience=patience)
+        reduce_lr = ReduceLROnPlateau('val_loss',
+                                      factor=0.1,
+                                      patience=int(patience / 4),
+                                      verbose=1)
+        trained_models_path = base_path + dataset_name + '_mini_XCEPTION'
+        model_names = trained_models_path + '.{epoch:02d}-{accuracy:.2f}.hdf5'
+        model_checkpoint = ModelCheckpoint(model_names,
+                                           'val_loss',
+                                           verbose=1,
+                                           save_best_only=True)
+        callbacks = [
+            StepsPerSecond(), model_checkpoint, csv_logger, early_stop, reduce_lr
+        ]
+
+        # loading dataset
+        # 只按样本序号划分，与原先对整个数组调用 train_test_split 的划分相同
+        num_samples = describe(data_path)[0]
+        train_index, test_index = train_test_split(np.arange(num_samples),
+                                                   test_size=validation_split,
+                                                   random_state=0)
+        train_mask = np.zeros(num_samples, bool)
+        train_mask[train_index] = True
+        train_data = make_dataset(data_path, train_mask, True)
+        test_data = make_dataset(data_path, ~train_mask, False)
 
-# data generator
-data_generator = ImageDataGenerator(featurewise_center=False,
-                                    featurewise_std_normalization=False,
-                                    rotation_range=10,
-                                    width_shift_range=0.1,
-                                    height_shift_range=0.1,
-                                    zoom_range=.1,
-                                    horizontal_flip=True)
-
-# model parameters/compilation
-model = mini_XCEPTION(input_shape, num_classes)
-model.compile(optimizer='adam',
-              loss='categorical_crossentropy',
-              metrics=['accuracy'])
-model.summary()
-
-datasets = ['fer2013']
-
-for dataset_name in datasets:
-    print('Training dataset:', dataset_name)
-    # callbacks
-    log_file_path = base_path + dataset_name + '_emotion_training.log'
-    csv_logger = CSVLogger(log_file_path, append=False)
-    early_stop = EarlyStopping('val_loss', patience=patience)
-    reduce_lr = ReduceLROnPlateau('val_loss',
-                                  factor=0.1,
-                                  patience=int(patience / 4),
-                                  verbose=1)
-    trained_models_path = base_path + dataset_name + '_mini_XCEPTION'
-    model_names = trained_models_path + '.{epoch:02d}-{accuracy:.2f}.hdf5'
-    model_checkpoint = ModelCheckpoint(model_names,
-                                       'val_loss',
-                                       verbose=1,
-                                       save_best_only=True)
-    callbacks = [model_checkpoint, csv_logger, early_stop, reduce_lr]
-
-    # loading dataset
-    f = h5py.File('models/Data.hdf5', 'r')
-    X = f['X'][()]  # type: ignore
-    X = uint2float(X)
-    Y = f['Y'][()]  # type: ignore
-    f.close()
-    #X = np.load('X.npy')
-    #Y = np.load('Y.npy')
-    train_X, test_X, train_Y, test_Y = train_test_split(
-        X, Y, test_size=validation_split, random_state=0)
-
-    model.fit_generator(data_generator.flow(train_X, train_Y, batch_size),
-                        steps_per_epoch=len(train_X) / batch_size,
-                        epochs=num_epochs,
-                        verbose=1,
-                        callbacks=callbacks,
-                        validation_data=(test_X, test_Y))
+        model.fit(train_data,
+                  steps_per_epoch=math.ceil(len(train_index) / batch_size),
+                  epochs=num_epochs,
+                  verbose=1,
+                  callbacks=callbacks,
+                  validation_data=test_data)
@@ -6,15 +6,28 @@
 # 本文件为逻辑层，负责收到控制层工作指令后开始工作，并回报执行结果
 #
 # RecImage
-# 图像识别器
+# 图像识别器，识别结果按图像内容缓存，重复识别同一张图像时直接取出
 #
 # RecVidio
 # 视频识别器
 #
 # RecCamera
-# 实时识别器
+# 实时识别器，画面静止时跳过检测和识别，沿用上一次的结果
+#
+# CameraStream
+# 多路识别中的一路视频来源，每路有独立的采集线程和识别线程
 #
-# 最后更新时间 2024/04/15
+# RecMulti
+# 多路识别器，所有来源的人脸交给同一个调度器合并识别表情
+#
+# 最后更新时间 2026/10/18
+
+from concurrent.futures import CancelledError
+from math import ceil, sqrt
+import os
+from queue import Empty, Full, Queue
+import threading
+import time
 
 import cv2
 from cv2 import VideoCapture
@@ -22,8 +35,11 @@ from cv2.typing import MatLike as CVImage
 import numpy as np
 from PyQt5.QtWidgets import QFileDialog
 
-from data import Result, PATH_RESULT, PATH_ORIGIN
-from visualmodule import Recognizer
+from data import Result, FACE_DETECT_INTERVAL_VIDIO, FACE_DETECT_INTERVAL_CAMERA, TRACK_CONFIDENCE, CHANGE_THRESHOLD, CHANGE_MAX_STALE, MULTI_SOURCES, MULTI_TILE
+from cache import ResultCache
+from scheduler import EmotionScheduler
+from stats import Stats
+from visualmodule import Recognizer, VideoReader
 
 
 # 图像识别器
@@ -59,34 +75,43 @@ class RecImage(Recognizer):
 
         # 将图像展示在屏幕上
         cls.img_origin = image
-        cv2.imwrite(PATH_ORIGIN, image)
+        cls.frame = image
         return Result.FINISH, path
 
     @classmethod
     def detectImg(cls) -> tuple[Result, str]:
-        # 获取灰度图像
-        img_gray = cv2.imread(PATH_ORIGIN, 0)
+        # 同一张图像已经识别过时直接取出结果
+        begin = Stats.clock()
+        key = ResultCache.key(cls.img_origin)
+        emotions = ResultCache.get(key)
+        Stats.record('cache', begin)
+        if emotions is None:
+            # 获取灰度图像
+            img_gray = cv2.cvtColor(cls.img_origin, cv2.COLOR_BGR2GRAY)
 
-        # 识别人脸位置
-        faces = cls.getFace(img_gray)
-        if len(faces) == 0:  # 找不到人脸
+            # 识别人脸位置和表情状态
+            emotions = cls.getEmotion(img_gray, cls.getFace(img_gray))
+            ResultCache.put(key, emotions)
+        if len(emotions) == 0:  # 找不到人脸
             return Result.FACE_NOT_FOUND, ''
 
-        # 识别表情状态
-        emotions = cls.getEmotion(img_gray, faces)
-
         # 将识别结果展示在屏幕图像框中
-        result, text = cls.markEmotion(cls.img_origin, emotions)
-        cv2.imwrite(PATH_RESULT, result)
+        result, text = cls.markEmotion(cls.img_origin.copy(), emotions)
+        cls.frame = result
+        Stats.frame(begin)
         return Result.FINISH, text
 
 
 # 视频识别器
 class RecVidio(Recognizer):
     vidio_origin: VideoCapture
+    vidio_reader: VideoReader | None = None
     vidio_index: int
     emotions: list[tuple]
     emotion_freq: int
+    img_prev: CVImage | None = None  # 上一帧的灰度图像，用于跟踪人脸
+    stream = True
+    drop_frames = False  # 视频文件不会丢失画面，队列满时等待而不是丢弃
 
     @classmethod
     def radioOn(cls):
@@ -95,6 +120,8 @@ class RecVidio(Recognizer):
     @classmethod
     def radioOff(cls):
         print('radio 2 off')
+        if cls.vidio_reader is not None:
+            cls.vidio_reader.release()  # 停止预读线程
 
     @classmethod
     def loadImg(cls) -> tuple[Result, str]:
@@ -106,54 +133,76 @@ class RecVidio(Recognizer):
             return Result.NO_FILE_SELECTED, _
 
         # 导入视频
+        if cls.vidio_reader is not None:
+            cls.vidio_reader.release()
+            cls.vidio_reader = None
         cls.vidio_origin = VideoCapture()  # 视频流
         ret = cls.vidio_origin.open(path)  # 参数是0，表示打开笔记本的内置摄像头，参数是视频文件路径则打开视频
         if ret is False:
             return Result.FILE_NOT_FOUND, _
 
         # 将视频的第一帧展示在屏幕上
-        cv2.waitKey(1)
         cls.vidio_index = 0
         cls.emotion_freq = 0
         _, frame = cls.vidio_origin.read()  # 从视频流中读取
-        cv2.imwrite(PATH_ORIGIN, frame)
+        cls.frame = frame
+        cls.vidio_origin.set(cv2.CAP_PROP_POS_FRAMES, 0)  # 仅在载入时回到开头一次
+        cls.vidio_reader = VideoReader(cls.vidio_origin)
         return Result.FINISH, path
 
+    # 从视频中顺序切分出图像信息
+    @classmethod
+    def readFrame(cls) -> tuple[bool, CVImage]:
+        ret, frame = cls.vidio_reader.read()  # type: ignore
+        cls.vidio_index = cls.vidio_reader.position  # type: ignore
+        return ret, frame
+
     @classmethod
     def detectImg(cls) -> tuple[Result, str]:
-        cv2.waitKey(1)
-        # 从视频中切分出图像信息
-        cls.vidio_origin.set(cv2.CAP_PROP_POS_FRAMES, cls.vidio_index)
-        ret, frame = cls.vidio_origin.read()
-        cls.vidio_index += 3
+        ret, frame = cls.readFrame()
         if ret is False:
             return Result.FINISH, ''
-        # cv2.imwrite(PATH_ORIGIN, frame)
+        return cls.processFrame(frame)
 
-        # 提高视频流畅程度，每识别一帧会冷却3帧
-        if cls.emotion_freq == 0:
-            # 获取灰度图像
-            # img_gray = cv2.imread(PATH_ORIGIN, 0)
-            img_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    # 识别单帧图像中的表情
+    @classmethod
+    def processFrame(cls, frame: CVImage) -> tuple[Result, str]:
+        # 获取灰度图像
+        begin = Stats.clock()
+        img_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        img_prev, cls.img_prev = cls.img_prev, img_gray
+        Stats.record('gray', begin)
+
+        # 提高视频流畅程度，两次检测之间用光流跟踪人脸框
+        if cls.emotion_freq > 0:
+            track = Stats.clock()
+            emotions, confidence = cls.trackFace(img_prev, img_gray,
+                                                 cls.emotions)
+            Stats.record('track', track)
+            if confidence < TRACK_CONFIDENCE:  # 跟丢了，立即重新检测
+                cls.emotion_freq = 0
+            else:
+                cls.emotions = emotions
+                cls.emotion_freq -= 1
 
+        if cls.emotion_freq == 0:
             # 识别人脸位置
             faces = cls.getFace(img_gray)
             if len(faces) == 0:  # 找不到人脸
-                cv2.imwrite(PATH_RESULT, frame)
+                cls.frame = frame
+                Stats.frame(begin)
                 return Result.FACE_NOT_FOUND_CONTINUE, ''
 
             # 识别表情状态
             cls.emotions = cls.getEmotion(img_gray, faces)
 
             # 冷却
-            cls.emotion_freq = 3
-        else:
-            cls.emotion_freq -= 1
+            cls.emotion_freq = FACE_DETECT_INTERVAL_VIDIO
 
         # 将识别结果展示在屏幕图像框中
         result, text = cls.markEmotion(frame, cls.emotions)
-        cv2.imwrite(PATH_RESULT, result)
-        # cv2.imwrite('file_temp/vedio_res.png', cv2.cvtColor(result, cv2.COLOR_RGB2BGR))
+        cls.frame = result
+        Stats.frame(begin)
 
         return Result.CONTINUE, text
 
@@ -163,6 +212,11 @@ class RecCamera(Recognizer):
     camera: VideoCapture
     emotions: list[tuple]
     emotion_freq: int
+    img_prev: CVImage | None = None  # 上一帧的灰度图像，用于跟踪人脸
+    img_ref: CVImage | None = None  # 上一次识别时画面的缩略图，用于判断画面是否变化
+    ref_time = 0.0  # 上一次识别的时间
+    stream = True
+    drop_frames = True  # 实时画面只保留最新的帧
 
     @classmethod
     def radioOn(cls):
@@ -183,45 +237,312 @@ class RecCamera(Recognizer):
         if ret is False:
             return Result.CAMERA_NOT_FOUND, ''
 
-        cv2.waitKey(1)
         cls.emotion_freq = 0
+        cls.emotions = []
+        cls.img_ref = None
         _, cover = cls.camera.read()  # 从视频流中读取
         cover = cv2.flip(cover, 1)
-        cv2.imwrite(PATH_ORIGIN, cover)
+        cls.frame = cover
         # cls.timer.start(30)  # 定时器开始计时30ms，结果是每过30ms从摄像头中取一帧显示
         return Result.CAMERA_START, ''
 
+    # 从视频流中读取
     @classmethod
-    def detectImg(cls) -> tuple[Result, str]:
-        cv2.waitKey(1)
-        # 从视频流中读取
+    def readFrame(cls) -> tuple[bool, CVImage]:
         ret, frame = cls.camera.read()
+        if ret is False:
+            return ret, frame
+        return ret, cv2.flip(frame, 1)
+
+    @classmethod
+    def detectImg(cls) -> tuple[Result, str]:
+        ret, frame = cls.readFrame()
         if ret is False:
             return Result.FINISH, ''
-        frame = cv2.flip(frame, 1)
-        # cv2.imwrite(PATH_ORIGIN, frame)
+        return cls.processFrame(frame)
 
-        # 提高视频流畅程度，每识别一帧会冷却3帧
-        if cls.emotion_freq == 0:
-            # 获取灰度图像
-            # img_gray = cv2.imread(PATH_ORIGIN, 0)
-            img_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    # 识别单帧图像中的表情
+    @classmethod
+    def processFrame(cls, frame: CVImage) -> tuple[Result, str]:
+        # 获取灰度图像
+        begin = Stats.clock()
+        img_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        gate = Stats.record('gray', begin)
+
+        # 画面几乎没有变化时跳过检测和识别，沿用上一次的结果
+        # 静止的画面超过最长沿用时间后重新检测一次，避免结果一直不更新
+        thumb = cls.thumbnail(img_gray)
+        now = time.monotonic()
+        changed = cls.frameChange(cls.img_ref, thumb) >= CHANGE_THRESHOLD
+        stale = now - cls.ref_time >= CHANGE_MAX_STALE
+        Stats.record('gate', gate)
+        if not changed and not stale:
+            return cls.showEmotion(frame, begin)
+        if not changed:
+            cls.emotion_freq = 0
+        cls.img_ref, cls.ref_time = thumb, now
+        # 跳过的画面不作为跟踪的参照，光流从上一次跟踪或识别的画面算起，累计的位移不会丢失
+        img_prev, cls.img_prev = cls.img_prev, img_gray
+
+        # 提高视频流畅程度，两次检测之间用光流跟踪人脸框
+        if cls.emotion_freq > 0:
+            track = Stats.clock()
+            emotions, confidence = cls.trackFace(img_prev, img_gray,
+                                                 cls.emotions)
+            Stats.record('track', track)
+            if confidence < TRACK_CONFIDENCE:  # 跟丢了，立即重新检测
+                cls.emotion_freq = 0
+            else:
+                cls.emotions = emotions
+                cls.emotion_freq -= 1
 
+        if cls.emotion_freq == 0:
             # 识别人脸位置
             faces = cls.getFace(img_gray)
             if len(faces) == 0:  # 找不到人脸
-                cv2.imwrite(PATH_RESULT, frame)
-                return Result.FACE_NOT_FOUND_CONTINUE, ''
+                cls.emotions = []
+                return cls.showEmotion(frame, begin)
 
             # 识别表情状态
             cls.emotions = cls.getEmotion(img_gray, faces)
 
             # 冷却
-            cls.emotion_freq = 5
-        else:
-            cls.emotion_freq -= 1
+            cls.emotion_freq = FACE_DETECT_INTERVAL_CAMERA
 
-        # 将识别结果展示在屏幕图像框中
+        return cls.showEmotion(frame, begin)
+
+    # 将当前的识别结果展示在屏幕图像框中
+    @classmethod
+    def showEmotion(cls, frame: CVImage, begin: float) -> tuple[Result, str]:
+        if len(cls.emotions) == 0:  # 找不到人脸
+            cls.frame = frame
+            Stats.frame(begin)
+            return Result.FACE_NOT_FOUND_CONTINUE, ''
         result, text = cls.markEmotion(frame, cls.emotions)
-        cv2.imwrite(PATH_RESULT, result)
+        cls.frame = result
+        Stats.frame(begin)
+        return Result.CONTINUE, text
+
+
+# 多路识别中的一路视频来源
+# 采集线程持续读取画面，识别线程检测人脸后把人脸图像交给共用的调度器识别表情
+# 实时来源只保留最新的一帧，视频文件则等待识别线程取走，不丢失画面
+class CameraStream():
+
+    def __init__(self, index: int, source, scheduler: EmotionScheduler,
+                 notify: threading.Event) -> None:
+        self.index = index
+        self.source = source
+        self.scheduler = scheduler
+        self.notify = notify  # 有新的识别结果时通知
+        self.capture = VideoCapture(source)
+        self.live = not (isinstance(source, str) and os.path.isfile(source))
+        self.frames: Queue = Queue(maxsize=1)
+        self.running = False
+        self.finished = False
+        self.frame: CVImage | None = None  # 最新的标记后的画面
+        self.text = ''
+        self.emotions: list[tuple] = []
+        self.emotion_freq = 0
+        self.img_prev: CVImage | None = None
+        # 各路检测线程同时检测人脸，每一路使用自己的检测器
+        self.clahe, self.cascade = Recognizer.createDetector()
+        self.threads = [
+            threading.Thread(target=self.captureLoop, daemon=True),
+            threading.Thread(target=self.detectLoop, daemon=True)
+        ]
+
+    def isOpened(self) -> bool:
+        return self.capture.isOpened()
+
+    def start(self) -> None:
+        self.running = True
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self.running = False
+        for thread in self.threads:
+            if thread.is_alive():
+                thread.join()
+        self.capture.release()
+
+    # 采集线程，实时来源处理不及时的时候丢弃旧的画面
+    def captureLoop(self) -> None:
+        while self.running:
+            ret, frame = self.capture.read()
+            if ret is False:
+                frame = None  # 视频流结束
+            while self.running:
+                try:
+                    self.frames.put(frame, timeout=0.1)
+                    break
+                except Full:
+                    if self.live:
+                        try:
+                            self.frames.get_nowait()  # 丢弃最旧的帧
+                        except Empty:
+                            pass
+            if frame is None:
+                return
+
+    # 识别线程，与实时识别器相同，两次检测之间用光流跟踪人脸框
+    # 单独一帧识别出错时跳过该帧，线程退出时总会标记为已结束，避免多路识别器一直等待
+    def detectLoop(self) -> None:
+        try:
+            while self.running:
+                try:
+                    frame = self.frames.get(timeout=0.1)
+                except Empty:
+                    continue
+                if frame is None:
+                    break
+                begin = Stats.clock()
+                try:
+                    self.processFrame(frame)
+                except Exception as e:
+                    print(f'第 {self.index + 1} 路识别失败 {e!r}')
+                    continue
+                Stats.frame(begin)
+                self.notify.set()
+        finally:
+            self.finished = True
+            self.notify.set()
+
+    # 识别单帧图像中的表情，人脸图像交给调度器与其他来源合并识别
+    def processFrame(self, frame: CVImage) -> None:
+        img_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        img_prev, self.img_prev = self.img_prev, img_gray
+
+        if self.emotion_freq > 0:
+            emotions, confidence = Recognizer.trackFace(
+                img_prev, img_gray, self.emotions)
+            if confidence < TRACK_CONFIDENCE:  # 跟丢了，立即重新检测
+                self.emotion_freq = 0
+            else:
+                self.emotions = emotions
+                self.emotion_freq -= 1
+
+        if self.emotion_freq == 0:
+            faces = Recognizer.getFace(img_gray, self.clahe, self.cascade)
+            boxes, crops = Recognizer.cropFace(img_gray, faces)
+            try:
+                emotions = self.scheduler.submit(self.index, crops,
+                                                 self.live).result()
+                self.emotions = [(*box, emotion)
+                                 for box, emotion in zip(boxes, emotions)]
+                if len(boxes) > 0:
+                    self.emotion_freq = FACE_DETECT_INTERVAL_CAMERA
+            except (CancelledError, RuntimeError):  # 请求被丢弃或调度器已停止
+                pass
+
+        if len(self.emotions) == 0:
+            self.frame, self.text = frame, Result.FACE_NOT_FOUND_CONTINUE.value
+        else:
+            self.frame, self.text = Recognizer.markEmotion(
+                frame, list(self.emotions))
+
+
+# 多路识别器，同时识别多个摄像头或视频来源，所有来源共用一份表情识别模型
+class RecMulti(Recognizer):
+    streams: list[CameraStream] = []
+    scheduler: EmotionScheduler | None = None
+    updated = threading.Event()  # 任意一路有新的识别结果
+    cancelled = False  # 后台线程已停止，readFrame 不再等待
+    stream = True
+    drop_frames = True  # 实时画面只保留最新的帧
+
+    @classmethod
+    def radioOn(cls):
+        print('radio 4 on')
+
+    @classmethod
+    def radioOff(cls):
+        print('radio 4 off')
+        cls.stopStreams()
+
+    # 停止所有来源和调度器
+    @classmethod
+    def stopStreams(cls) -> None:
+        for stream in cls.streams:
+            stream.stop()
+        cls.streams = []
+        if cls.scheduler is not None:
+            cls.scheduler.close()
+            cls.scheduler = None
+
+    @classmethod
+    def loadImg(cls, flag=Result.PREPARE) -> tuple[Result, str]:
+        if flag is Result.PREPARE:
+            return Result.LOADING, ''
+
+        cls.stopStreams()
+        cls.scheduler = EmotionScheduler()
+        cls.updated.clear()
+        for index, source in enumerate(MULTI_SOURCES):
+            stream = CameraStream(index, source, cls.scheduler, cls.updated)
+            if stream.isOpened():
+                cls.streams.append(stream)
+            else:
+                print(f'无法打开视频来源 {source}')
+                stream.capture.release()
+        if len(cls.streams) == 0:
+            cls.stopStreams()
+            return Result.CAMERA_NOT_FOUND, ''
+
+        for stream in cls.streams:
+            stream.start()
+        cls.frame = cls.mosaic()
+        return Result.CAMERA_START, ''
+
+    # 将各路最新的画面缩放后拼接为一张图像
+    @classmethod
+    def mosaic(cls) -> CVImage:
+        width, height = MULTI_TILE
+        cols = ceil(sqrt(len(cls.streams)))
+        rows = ceil(len(cls.streams) / cols)
+        result = np.zeros((rows * height, cols * width, 3), np.uint8)
+        for i, stream in enumerate(cls.streams):
+            if stream.frame is None:
+                continue
+            # 保持原画面的宽高比，居中放入对应的格子
+            h, w = stream.frame.shape[:2]
+            scale = min(width / w, height / h)
+            tile = cv2.resize(stream.frame,
+                              (max(round(w * scale), 1), max(round(h * scale), 1)),
+                              interpolation=cv2.INTER_AREA)
+            row, col = divmod(i, cols)
+            y = row * height + (height - tile.shape[0]) // 2
+            x = col * width + (width - tile.shape[1]) // 2
+            result[y:y + tile.shape[0], x:x + tile.shape[1]] = tile
+        return result
+
+    # readFrame 每 0.1 秒检查一次，不需要额外唤醒
+    @classmethod
+    def cancelRead(cls, cancel: bool = True) -> None:
+        cls.cancelled = cancel
+
+    # 等待任意一路有新的识别结果，所有来源都结束或后台线程停止后返回 False
+    @classmethod
+    def readFrame(cls) -> tuple[bool, CVImage]:
+        while not cls.cancelled and not all(stream.finished
+                                            for stream in cls.streams):
+            if cls.updated.wait(0.1):
+                cls.updated.clear()
+                return True, cls.mosaic()
+        return False, cls.frame
+
+    @classmethod
+    def detectImg(cls) -> tuple[Result, str]:
+        ret, frame = cls.readFrame()
+        if ret is False:
+            return Result.FINISH, ''
+        return cls.processFrame(frame)
+
+    # 拼接后的画面已经标记完成，这里只整理各路的文本信息
+    @classmethod
+    def processFrame(cls, frame: CVImage) -> tuple[Result, str]:
+        cls.frame = frame
+        text = '\n'.join(f'[{stream.index + 1}] {stream.text}'
+                         for stream in cls.streams)
         return Result.CONTINUE, text
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+# 基于机器视觉的人脸表情识别系统设计-汪哲文毕业设计
+#
+# scheduler.py
+# 本文件为逻辑层，负责把多个来源提交的人脸图像合并为批次，统一交给表情识别模型
+# 多路摄像头、HTTP 服务等共用同一份模型，不必每个来源各自载入
+#
+# EmotionRequest
+# 一次提交的人脸图像，可能被拆分到多个批次中识别
+#
+# EmotionScheduler
+# 表情识别的调度器，在后台线程中按批次识别各来源提交的人脸图像
+#
+# submit
+# 提交一组人脸图像，返回识别结果的 Future
+#
+# take
+# 按轮转的顺序从各来源取出人脸图像组成一个批次，保证各来源公平
+#
+# run
+# 调度线程，等待凑满一个批次或超过等待时间后识别
+#
+# close
+# 停止调度线程，未识别的请求全部取消
+#
+# 最后更新时间 2026/10/18
+
+from collections import deque
+from concurrent.futures import Future
+import threading
+import time
+
+import numpy as np
+
+from data import EMOTION_BATCH_SIZE, EMOTION_LABELS, SCHEDULER_WAIT, SCHEDULER_PENDING
+from visualmodule import Recognizer
+
+
+# 一次提交的人脸图像，offset 之前的部分已经交给模型，filled 为已得到结果的数量
+class EmotionRequest():
+    __slots__ = ('crops', 'future', 'results', 'offset', 'filled')
+
+    def __init__(self, crops: list) -> None:
+        self.crops = crops
+        self.future = Future()
+        self.results = np.zeros((len(crops), len(EMOTION_LABELS)), np.float32)
+        self.offset = 0
+        self.filled = 0
+
+
+# 表情识别的调度器
+# 各来源的请求分别排队，组批时按轮转的顺序每次从一个来源最多取 quantum 张人脸
+# 人脸多的来源不会让其他来源长时间等待
+class EmotionScheduler():
+
+    def __init__(self,
+                 batch_size: int = EMOTION_BATCH_SIZE,
+                 wait: float = SCHEDULER_WAIT,
+                 pending: int = SCHEDULER_PENDING) -> None:
+        self.batch_size = batch_size
+        self.wait = wait  # 凑批次时最多等待的秒数
+        self.pending = pending  # 允许丢弃的来源最多排队的请求数
+        self.queues: dict[object, deque] = {}
+        self.order: deque = deque()  # 轮转的来源顺序
+        self.count = 0  # 排队中尚未交给模型的人脸数量
+        self.since = 0.0  # 队列由空变为非空的时间
+        self.closed = False
+        self.batches = 0  # 已识别的批次数
+        self.faces = 0  # 已识别的人脸数
+        self.dropped = 0  # 被丢弃的请求数
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # 提交一组人脸图像，返回识别结果（N*7 的概率）的 Future
+    # drop 为真时，该来源排队的请求超过上限后丢弃最旧的请求，适用于只关心最新画面的实时来源
+    def submit(self, source, crops: list, drop: bool = False) -> Future:
+        request = EmotionRequest(list(crops))
+        if len(request.crops) == 0:
+            request.future.set_result(request.results)
+            return request.future
+        with self.cond:
+            if self.closed:
+                raise RuntimeError('表情识别调度器已停止')
+            queue = self.queues.get(source)
+            if queue is None:
+                queue = self.queues[source] = deque()
+                self.order.append(source)
+            if drop:
+                # 只丢弃尚未开始识别的请求
+                waiting = [r for r in queue if r.offset == 0]
+                while len(queue) >= max(self.pending, 1) and waiting:
+                    old = waiting.pop(0)
+                    queue.remove(old)
+                    old.future.cancel()
+                    self.count -= len(old.crops)
+                    self.dropped += 1
+            if self.count == 0:
+                self.since = time.monotonic()
+            queue.append(request)
+            self.count += len(request.crops)
+            self.cond.notify_all()
+        return request.future
+
+    # 按轮转的顺序从各来源取出人脸图像组成一个批次
+    # 返回 [(请求, 起点, 数量)]，调用时需持有锁
+    def take(self) -> list[tuple[EmotionRequest, int, int]]:
+        pieces = []
+        space = self.batch_size
+        active = sum(1 for queue in self.queues.values() if queue)
+        quantum = max(self.batch_size // max(active, 1), 1)
+        while space > 0 and self.count > 0:
+            for _ in range(len(self.order)):
+                source = self.order[0]
+                self.order.rotate(-1)  # 下一次从下一个来源开始取
+                queue = self.queues[source]
+                if not queue:
+                    continue
+                request = queue[0]
+                if (request.offset == 0 and
+                        not request.future.set_running_or_notify_cancel()):
+                    queue.popleft()  # 提交方已经取消
+                    self.count -= len(request.crops)
+                    continue
+                n = min(quantum, space, len(request.crops) - request.offset)
+                pieces.append((request, request.offset, n))
+                request.offset += n
+                self.count -= n
+                space -= n
+                if request.offset == len(request.crops):
+                    queue.popleft()
+                if space == 0:
+                    break
+        # 移除已经没有请求的来源
+        for source in [s for s, queue in self.queues.items() if not queue]:
+            del self.queues[source]
+            self.order.remove(source)
+        self.since = time.monotonic()
+        return pieces
+
+    # 调度线程，等待凑满一个批次或最早的请求等待超过 wait 秒后识别
+    def run(self) -> None:
+        while True:
+            with self.cond:
+                while not self.closed and self.count == 0:
+                    self.cond.wait()
+                while not self.closed and self.count < self.batch_size:
+                    remaining = self.since + self.wait - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                if self.closed:
+                    return
+                pieces = self.take()
+            if len(pieces) == 0:
+                continue
+
+            crops = []
+            for request, start, n in pieces:
+                crops.extend(request.crops[start:start + n])
+            try:
+                emotions = Recognizer.predictEmotion(crops, self.batch_size)
+            except Exception as e:
+                for request, _, _ in pieces:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+            self.batches += 1
+            self.faces += len(crops)
+
+            # 将结果分发回各个请求
+            offset = 0
+            for request, start, n in pieces:
+                request.results[start:start + n] = emotions[offset:offset + n]
+                offset += n
+                request.filled += n
+                if (request.filled == len(request.crops)
+                        and not request.future.done()):
+                    request.future.set_result(request.results)
+
+    # 停止调度线程，未识别的请求全部取消
+    def close(self) -> None:
+        with self.cond:
+            self.closed = True
+            for queue in self.queues.values():
+                for request in queue:
+                    if request.offset == 0:
+                        request.future.cancel()
+                    elif not request.future.done():
+                        request.future.set_exception(
+                            RuntimeError('表情识别调度器已停止'))
+            self.queues.clear()
+            self.order.clear()
+            self.count = 0
+            self.cond.notify_all()
+        self.thread.join()
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+# 基于机器视觉的人脸表情识别系统设计-汪哲文毕业设计
+#
+# server.py
+# 本文件为表现层，提供基于 asyncio 的 HTTP 识别服务，供其他进程或其他电脑调用
+# 整个服务只载入一份模型，人脸检测在线程池中进行，并发请求的人脸合并为批次识别表情
+#
+# python server.py [--host 127.0.0.1] [--port 8600] [--threads 线程数]
+# curl --data-binary @assets/happy.png http://127.0.0.1:8600/recognize
+#
+# RecognitionServer
+# 识别服务，负责解析 HTTP 请求并返回 JSON 格式的识别结果
+#
+# initThread
+# 检测线程池的初始化函数，每个线程创建各自的 CLAHE 和人脸检测器
+#
+# detect
+# 解码图像并检测人脸，在线程池中运行
+#
+# recognize
+# 识别一张图像，人脸图像交给调度器与其他请求合并识别
+#
+# handle
+# 处理一个连接上的所有请求，支持 HTTP/1.1 长连接
+#
+# respond
+# 写出 JSON 格式的响应
+#
+# 最后更新时间 2026/10/18
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from batch import faceRows
+from data import Models, SERVER_HOST, SERVER_PORT, SERVER_THREADS, SERVER_WAIT, SERVER_MAX_BODY
+from scheduler import EmotionScheduler
+from stats import Stats
+from visualmodule import Recognizer
+
+# HTTP 状态码对应的说明
+STATUS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+
+# 识别服务
+class RecognitionServer():
+
+    def __init__(self,
+                 threads: int | None = SERVER_THREADS,
+                 wait: float = SERVER_WAIT) -> None:
+        # 检测线程各自使用一组 CLAHE 和人脸检测器，二者都不是线程安全的
+        self.local = threading.local()
+        self.pool = ThreadPoolExecutor(threads, initializer=self.initThread)
+        self.scheduler = EmotionScheduler(wait=wait)
+        self.requests = 0  # 已处理的识别请求数
+        self.begin = time.time()
+
+    # 检测线程池的初始化函数，为每个线程创建各自的检测器
+    def initThread(self) -> None:
+        self.local.clahe, self.local.cascade = Recognizer.createDetector()
+
+    # 解码图像并检测人脸，在线程池中运行，OpenCV 计算时会释放 GIL
+    def detect(self, body: bytes) -> tuple[list[tuple], list]:
+        try:
+            image = cv2.imdecode(np.frombuffer(body, np.uint8),
+                                 cv2.IMREAD_GRAYSCALE)
+        except cv2.error:  # 请求体为空时 imdecode 直接报错
+            image = None
+        if image is None:
+            raise ValueError('无法解码图像')
+        faces = Recognizer.getFace(image, self.local.clahe,
+                                   self.local.cascade)
+        return Recognizer.cropFace(image, faces)
+
+    # 识别一张图像，返回每张人脸的位置、微表情和七种表情的概率
+    # 同一客户端的请求作为调度器中的同一个来源，不同客户端之间轮流组批
+    async def recognize(self, body: bytes, client) -> dict:
+        begin = Stats.clock()
+        loop = asyncio.get_running_loop()
+        boxes, crops = await loop.run_in_executor(self.pool, self.detect,
+                                                  body)
+        emotions = await asyncio.wrap_future(
+            self.scheduler.submit(client, crops))
+        self.requests += 1
+        Stats.record('request', begin)
+        result = [(*box, emotion) for box, emotion in zip(boxes, emotions)]
+        return {'faces': faceRows(result, {})}
+
+    # 服务的运行状态
+    def health(self) -> dict:
+        return {
+            'status': 'ok',
+            'uptime': round(time.time() - self.begin, 1),
+            'requests': self.requests,
+            'batches': self.scheduler.batches,
+            'faces': self.scheduler.faces,
+        }
+
+    # 处理一个连接上的所有请求，支持 HTTP/1.1 长连接
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        client = writer.get_extra_info('peername')
+        client = client[0] if client else None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode('latin-1').split()
+                except ValueError:
+                    await self.respond(writer, 400, {'error': '请求行格式错误'},
+                                       False)
+                    break
+
+                # 读取请求头
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep = (version == 'HTTP/1.1' and
+                        headers.get('connection', '').lower() != 'close')
+
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    await self.respond(writer, 400,
+                                       {'error': 'Content-Length 格式错误'},
+                                       False)
+                    break
+                if length > SERVER_MAX_BODY:
+                    await self.respond(writer, 413, {'error': '图像过大'},
+                                       False)
+                    break
+                body = await reader.readexactly(length)
+
+                path = target.split('?', 1)[0]
+                if path == '/health':
+                    status, result = 200, self.health()
+                elif path != '/recognize':
+                    status, result = 404, {'error': f'找不到 {path}'}
+                elif method != 'POST':
+                    status, result = 405, {'error': '请使用 POST 上传图像'}
+                else:
+                    try:
+                        status, result = 200, await self.recognize(
+                            body, client)
+                    except ValueError as e:
+                        status, result = 400, {'error': str(e)}
+                    except Exception as e:
+                        print(f'识别失败 {e!r}')
+                        status, result = 500, {'error': repr(e)}
+                await self.respond(writer, status, result, keep)
+                if not keep:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # 客户端提前断开
+        finally:
+            writer.close()
+
+    # 写出 JSON 格式的响应
+    async def respond(self, writer: asyncio.StreamWriter, status: int,
+                      result: dict, keep: bool) -> None:
+        body = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        head = (f'HTTP/1.1 {status} {STATUS[status]}\r\n'
+                'Content-Type: application/json; charset=utf-8\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: {"keep-alive" if keep else "close"}\r\n\r\n')
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    # 启动服务，直到被中断
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f'识别服务已启动 http://{host}:{port}/recognize')
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        self.scheduler.close()
+        self.pool.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='人脸表情识别服务')
+    parser.add_argument('--host', default=SERVER_HOST, help='监听地址')
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help='监听端口')
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS,
+                        help='人脸检测的线程数，默认为 CPU 核心数')
+    parser.add_argument('--wait', type=float, default=SERVER_WAIT,
+                        help='合并请求时最多等待的秒数')
+    args = parser.parse_args()
+
+    Models.load()  # 启动前载入并预热模型，所有请求共用
+    server = RecognitionServer(args.threads, args.wait)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
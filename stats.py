@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+# 基于机器视觉的人脸表情识别系统设计-汪哲文毕业设计
+#
+# stats.py
+# 本文件为逻辑层，负责统计识别流程中各个环节的耗时
+# 关闭统计时每个记录点只判断一次开关，几乎没有额外开销
+#
+# Stats
+# 各环节耗时的滚动统计，只保留最近的若干次记录
+#
+# clock
+# 返回当前时间，关闭统计时直接返回 0
+#
+# record
+# 记录一个环节从 begin 到现在的耗时，返回当前时间便于连续记录下一个环节
+#
+# frame
+# 记录一帧完整的处理耗时，同时用于计算帧率
+#
+# summary
+# 汇总各环节耗时的均值、p50/p95/p99 和帧率
+#
+# histogram
+# 按对数间隔的区间统计一个环节的耗时分布
+#
+# overlay
+# 整理成显示在图像框上的简短文本
+#
+# dump
+# 将统计结果和直方图导出为 JSON 文件
+#
+# 最后更新时间 2026/10/18
+
+from collections import deque
+import json
+import os
+from time import perf_counter, strftime
+
+import numpy as np
+
+from data import STATS_ENABLED, STATS_WINDOW, STATS_BINS, PATH_STATS
+
+
+# 各环节耗时的滚动统计，只保留最近 STATS_WINDOW 次的记录
+# 记录可能来自采集、识别和界面多个线程，deque 的追加是线程安全的
+class Stats():
+    enabled = STATS_ENABLED
+    samples: dict[str, deque] = {}  # 各环节的耗时（毫秒）
+    ticks: deque = deque(maxlen=STATS_WINDOW)  # 每帧处理完成的时间
+
+    # 开启或关闭统计，重新开启时清空旧的记录
+    @classmethod
+    def enable(cls, enabled: bool = True) -> None:
+        if enabled and not cls.enabled:
+            cls.reset()
+        cls.enabled = enabled
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.samples = {}
+        cls.ticks = deque(maxlen=STATS_WINDOW)
+
+    # 返回当前时间，关闭统计时直接返回 0
+    @classmethod
+    def clock(cls) -> float:
+        return perf_counter() if cls.enabled else 0.0
+
+    # 记录一个环节从 begin 到现在的耗时，返回当前时间便于连续记录下一个环节
+    @classmethod
+    def record(cls, stage: str, begin: float) -> float:
+        if not cls.enabled:
+            return 0.0
+        now = perf_counter()
+        if begin > 0:  # 统计中途开启时，忽略开启前开始的环节
+            history = cls.samples.get(stage)
+            if history is None:
+                history = cls.samples.setdefault(stage,
+                                                 deque(maxlen=STATS_WINDOW))
+            history.append((now - begin) * 1000)
+        return now
+
+    # 记录一帧完整的处理耗时，同时用于计算帧率
+    @classmethod
+    def frame(cls, begin: float) -> None:
+        now = cls.record('frame', begin)
+        if now > 0:
+            cls.ticks.append(now)
+
+    # 最近若干帧的平均帧率
+    @classmethod
+    def fps(cls) -> float:
+        ticks = list(cls.ticks)
+        if len(ticks) < 2 or ticks[-1] <= ticks[0]:
+            return 0.0
+        return (len(ticks) - 1) / (ticks[-1] - ticks[0])
+
+    # 汇总各环节耗时的均值、p50/p95/p99 和帧率
+    @classmethod
+    def summary(cls) -> dict:
+        stages = {}
+        for stage, history in list(cls.samples.items()):
+            values = np.array(history)
+            if len(values) == 0:
+                continue
+            p50, p95, p99 = np.percentile(values, (50, 95, 99))
+            stages[stage] = {
+                'count': len(values),
+                'mean_ms': round(float(values.mean()), 3),
+                'p50_ms': round(float(p50), 3),
+                'p95_ms': round(float(p95), 3),
+                'p99_ms': round(float(p99), 3),
+                'max_ms': round(float(values.max()), 3),
+            }
+        return {'fps': round(cls.fps(), 2), 'stages': stages}
+
+    # 按对数间隔的区间统计一个环节的耗时分布，区间为 0.01 毫秒到 10 秒
+    @classmethod
+    def histogram(cls, stage: str, bins: int = STATS_BINS) -> dict:
+        edges = np.logspace(-2, 4, bins + 1)
+        values = np.clip(np.array(cls.samples.get(stage, ())), edges[0],
+                         edges[-1])
+        counts, _ = np.histogram(values, edges)
+        return {
+            'edges_ms': [round(float(e), 4) for e in edges],
+            'counts': counts.tolist()
+        }
+
+    # 整理成显示在图像框上的简短文本
+    @classmethod
+    def overlay(cls) -> str:
+        summary = cls.summary()
+        lines = [f'FPS {summary["fps"]:.1f}']
+        for stage, item in summary['stages'].items():
+            lines.append(f'{stage} {item["p50_ms"]:.1f}/'
+                         f'{item["p95_ms"]:.1f} ms')
+        return '\n'.join(lines)
+
+    # 将统计结果和直方图导出为 JSON 文件
+    @classmethod
+    def dump(cls, path: str = PATH_STATS) -> str:
+        result = cls.summary()
+        result['time'] = strftime('%Y-%m-%d %H:%M:%S')
+        result['histograms'] = {
+            stage: cls.histogram(stage)
+            for stage in result['stages']
+        }
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        return path
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+# 测试在仓库根目录下运行，模型和素材使用相对路径
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+# 识别结果缓存的测试
+# 内存缓存按最近使用淘汰，磁盘缓存重新载入后仍能命中，后端或模型文件改变后不再命中
+
+from collections import OrderedDict
+import os
+
+import numpy as np
+import pytest
+
+import data
+from cache import ResultCache
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(ResultCache, 'memory', OrderedDict())
+    monkeypatch.setattr(ResultCache, 'size', 3)
+    monkeypatch.setattr(ResultCache, 'disk', '')
+    return tmp_path
+
+
+def emotions(seed: int) -> list[tuple]:
+    rng = np.random.default_rng(seed)
+    return [(10 * seed, 20, 10 * seed + 48, 68,
+             rng.dirichlet(np.ones(len(data.EMOTION_LABELS))))]
+
+
+def same(a: list[tuple], b: list[tuple]) -> bool:
+    return len(a) == len(b) and all(
+        x[:4] == y[:4] and np.allclose(x[4], y[4]) for x, y in zip(a, b))
+
+
+def test_memory_evicts_least_recently_used(cache):
+    for i, key in enumerate('abc'):
+        ResultCache.put(key, emotions(i))
+    assert ResultCache.get('a') is not None  # a 变为最近使用
+    ResultCache.put('d', emotions(3))
+    assert ResultCache.get('b') is None
+    for i, key in zip((0, 2, 3), 'acd'):
+        assert same(ResultCache.get(key), emotions(i))
+    assert len(ResultCache.memory) == 3
+
+
+def test_disk_round_trip(cache, monkeypatch):
+    monkeypatch.setattr(ResultCache, 'disk', str(cache / 'results'))
+    image = np.full((32, 32, 3), 7, np.uint8)
+    key = ResultCache.key(image)
+    ResultCache.put(key, emotions(1))
+    ResultCache.clear()  # 模拟重新启动，只剩磁盘上的结果
+    result = ResultCache.get(key)
+    assert result is not None and same(result, emotions(1))
+    assert result[0][4].dtype == np.float32
+
+
+def test_key_changes_with_backend_and_model(cache, monkeypatch):
+    model = cache / 'model.hdf5'
+    model.write_bytes(b'old')
+    monkeypatch.setattr(data, 'EMOTION_BACKEND', 'keras')
+    monkeypatch.setattr(data, 'MODEL_EMOTION', str(model))
+    image = np.zeros((16, 16), np.uint8)
+    key = ResultCache.key(image)
+    ResultCache.put(key, emotions(0))
+    assert ResultCache.key(image) == key
+
+    monkeypatch.setattr(data, 'EMOTION_BACKEND', 'numpy')
+    assert ResultCache.get(ResultCache.key(image)) is None
+    monkeypatch.setattr(data, 'EMOTION_BACKEND', 'keras')
+
+    model.write_bytes(b'new model')
+    os.utime(model, ns=(1, 1))
+    assert ResultCache.get(ResultCache.key(image)) is None
+
+
+def test_key_changes_with_quantized_model(cache, monkeypatch):
+    monkeypatch.setattr(data, 'EMOTION_BACKEND', 'tflite_int8')
+    monkeypatch.setattr(data, 'MODEL_EMOTION', str(cache / 'model.hdf5'))
+    quantized = cache / 'model.int8.tflite'  # 后端实际读取的量化模型
+    quantized.write_bytes(b'old')
+    image = np.zeros((16, 16), np.uint8)
+    key = ResultCache.key(image)
+    quantized.write_bytes(b'new model')
+    assert ResultCache.key(image) != key
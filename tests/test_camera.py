@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+# 摄像头识别的跟踪测试
+# 画面变化很小时跳过的帧不能替换跟踪的参照帧，否则人脸框只会跟上最后一帧的位移
+
+import cv2
+import numpy as np
+import pytest
+
+import data
+import recognizer
+from data import Models
+from recognizer import RecCamera
+
+WIDTH, HEIGHT = 640, 480
+FRAMES = 50
+
+
+# 缓慢平移的画面，人脸放在有纹理的背景上，每帧向右移动 1 像素
+def panning():
+    rng = np.random.default_rng(0)
+    scene = cv2.GaussianBlur(
+        rng.integers(0, 256, (HEIGHT, WIDTH + FRAMES, 3), np.uint8), (5, 5), 0)
+    face = cv2.imread('assets/happy.png')  # 素材中有多张人脸
+    scene[40:40 + face.shape[0], 60:60 + face.shape[1]] = face
+    for t in range(FRAMES):
+        yield np.ascontiguousarray(scene[:, FRAMES - t:FRAMES - t + WIDTH])
+
+
+@pytest.fixture
+def camera(monkeypatch):
+    data.EMOTION_BACKEND = 'numpy'  # 不依赖 TensorFlow，载入更快
+    Models.load()
+    # 只检测第一帧，之后完全依靠跟踪，人脸框的位移只来自光流
+    monkeypatch.setattr(recognizer, 'FACE_DETECT_INTERVAL_CAMERA', 1000)
+    monkeypatch.setattr(recognizer, 'CHANGE_MAX_STALE', 1000.0)
+    monkeypatch.setattr(RecCamera, 'emotion_freq', 0, raising=False)
+    monkeypatch.setattr(RecCamera, 'emotions', [], raising=False)
+    monkeypatch.setattr(RecCamera, 'img_prev', None)
+    monkeypatch.setattr(RecCamera, 'img_ref', None)
+    monkeypatch.setattr(RecCamera, 'ref_time', 0.0)
+
+
+def test_tracking_follows_slow_pan(camera):
+    frames = list(panning())
+    RecCamera.processFrame(frames[0].copy())
+    start = [box[0] for box in RecCamera.emotions]
+    assert len(start) > 0
+
+    # 跳过的帧沿用上一次的结果，人脸框应跟上最后一次通过变化检测的画面
+    skipped, last = 0, 0
+    for t, frame in enumerate(frames[1:], 1):
+        before = RecCamera.ref_time
+        RecCamera.processFrame(frame.copy())
+        if RecCamera.ref_time == before:
+            skipped += 1
+        else:
+            last = t
+    assert skipped > 0  # 平移足够慢，变化检测确实跳过了一部分帧
+
+    assert len(RecCamera.emotions) == len(start)  # 一直在跟踪，没有重新检测
+    for box, x in zip(RecCamera.emotions, start):
+        assert abs(box[0] - x - last) <= 2
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+# 分块检测的线程安全测试
+# 多个线程同时检测图块时，每个线程必须使用自己的人脸检测器，否则结果会变化甚至崩溃
+
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+
+import visualmodule
+from data import Models, MODEL_FACE
+from visualmodule import Recognizer
+
+ASSETS = ('angry', 'disgust', 'fear', 'happy', 'sad', 'surprised')
+
+
+# 由素材拼成的大图，每张图块中都有人脸
+def mosaic() -> np.ndarray:
+    faces = []
+    for name in ASSETS:
+        image = cv2.imread(f'assets/{name}.png', cv2.IMREAD_GRAYSCALE)
+        faces.append(cv2.resize(image, (640, 640)))
+    return np.vstack([np.hstack(faces[:3]), np.hstack(faces[3:])])
+
+
+@pytest.fixture
+def tiled(monkeypatch):
+    Models.face = cv2.CascadeClassifier(MODEL_FACE)
+    monkeypatch.setattr(visualmodule, 'FACE_TILE_SIZE', 480)
+    monkeypatch.setattr(visualmodule, 'FACE_TILE_OVERLAP', 160)
+    pool = ThreadPoolExecutor(16, initializer=Recognizer.initTile)
+    monkeypatch.setattr(Recognizer, 'tile_pool', pool)
+    yield
+    pool.shutdown()
+
+
+def test_tiled_detection_is_repeatable(tiled):
+    image = mosaic()
+    expected = Recognizer.getFace(image)
+    assert len(expected) > 0
+    for _ in range(15):
+        assert Recognizer.getFace(image) == expected
+
+
+def test_detectors_are_independent():
+    clahe, cascade = Recognizer.createDetector()
+    other, _ = Recognizer.createDetector()
+    assert clahe is not other
+    assert clahe.getClipLimit() == visualmodule.CLAHE_FACE.getClipLimit()
+    assert not cascade.empty()
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+# NumPy 推理引擎与 Keras 的对比
+# BatchNormalization 合并到卷积后，输出的概率应与 Keras 一致，表情的排序不变
+
+import numpy as np
+import pytest
+
+from backend import NumpyBackend
+from data import MODEL_EMOTION
+
+
+def test_numpy_matches_keras():
+    pytest.importorskip('tensorflow')
+    from backend import KerasBackend
+
+    engine = NumpyBackend(MODEL_EMOTION)
+    keras = KerasBackend(MODEL_EMOTION)
+    rng = np.random.default_rng(0)
+    x = rng.uniform(-1, 1, (16, *engine.input_shape[1:])).astype(np.float32)
+    expected = keras.predict(x)
+    result = engine.predict(x)
+    assert result.shape == expected.shape
+    np.testing.assert_allclose(result, expected, atol=1e-5)
+    assert (result.argmax(1) == expected.argmax(1)).all()
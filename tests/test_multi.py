@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+# 多路识别的退出测试
+# 某一路识别出错时该路仍要标记为已结束，后台线程停止时 readFrame 不能一直等待
+
+import threading
+
+import numpy as np
+import pytest
+
+from recognizer import CameraStream, RecMulti
+from scheduler import EmotionScheduler
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    scheduler = EmotionScheduler()
+    stream = CameraStream(0, 'missing.mp4', scheduler, threading.Event())
+    yield stream
+    stream.running = False
+    scheduler.close()
+
+
+def test_stream_finishes_after_error(stream, monkeypatch):
+    calls = []
+
+    def fail(frame):
+        calls.append(frame)
+        raise RuntimeError('识别失败')
+
+    monkeypatch.setattr(stream, 'processFrame', fail)
+    stream.running = True
+    thread = threading.Thread(target=stream.detectLoop, daemon=True)
+    thread.start()
+    stream.frames.put(np.zeros((8, 8, 3), np.uint8))
+    stream.frames.put(np.zeros((8, 8, 3), np.uint8), timeout=5)
+    stream.frames.put(None, timeout=5)
+    thread.join(5)
+    assert not thread.is_alive()
+    assert len(calls) == 2  # 出错后继续识别下一帧
+    assert stream.finished
+
+
+def test_read_frame_returns_when_cancelled(stream, monkeypatch):
+    monkeypatch.setattr(RecMulti, 'streams', [stream])
+    monkeypatch.setattr(RecMulti, 'frame', None, raising=False)
+    RecMulti.cancelRead(False)
+    threading.Timer(0.2, RecMulti.cancelRead).start()
+    ret, _ = RecMulti.readFrame()
+    assert ret is False
+    RecMulti.cancelRead(False)
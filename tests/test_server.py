@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# 识别服务的并发测试
+# 并发请求的检测在线程池中同时进行，结果必须与单独发送同一张图像时一致
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import json
+import socket
+import threading
+
+import pytest
+
+import data
+from data import Models
+from server import RecognitionServer
+
+ASSETS = ('angry', 'happy', 'sad', 'surprised')
+
+
+def freePort() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def server():
+    data.EMOTION_BACKEND = 'numpy'  # 不依赖 TensorFlow，载入更快
+    Models.load()
+    port = freePort()
+    service = RecognitionServer(threads=8, wait=0.02)
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(service.serve('127.0.0.1', port))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    for _ in range(100):  # 等待服务开始监听
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.1).close()
+            break
+        except OSError:
+            threading.Event().wait(0.05)
+    yield port
+    loop.call_soon_threadsafe(task.cancel)
+    service.close()
+
+
+def recognize(port: int, body: bytes) -> list[dict]:
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    connection.request('POST', '/recognize', body)
+    response = connection.getresponse()
+    assert response.status == 200
+    result = json.loads(response.read())['faces']
+    connection.close()
+    return result
+
+
+def same(a: list[dict], b: list[dict]) -> bool:
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if any(x[k] != y[k] for k in ('x1', 'y1', 'x2', 'y2')):
+            return False
+        if any(abs(x[k] - y[k]) > 1e-4 for k in data.EMOTION_LABELS.values()):
+            return False
+    return True
+
+
+def test_concurrent_requests_match_single(server):
+    images = {}
+    for name in ASSETS:
+        with open(f'assets/{name}.png', 'rb') as f:
+            images[name] = f.read()
+    expected = {name: recognize(server, body) for name, body in images.items()}
+    assert all(len(faces) > 0 for faces in expected.values())
+
+    names = list(ASSETS) * 8
+    with ThreadPoolExecutor(len(names)) as pool:
+        results = list(pool.map(lambda n: recognize(server, images[n]),
+                                names))
+    mismatched = [n for n, r in zip(names, results) if not same(r, expected[n])]
+    assert mismatched == []
+
+
+# 直接发送原始请求，返回响应的状态码
+def rawStatus(port: int, request: bytes) -> int:
+    with socket.create_connection(('127.0.0.1', port), 10) as s:
+        s.sendall(request)
+        line = s.makefile('rb').readline()
+    return int(line.split()[1])
+
+
+def test_invalid_content_length(server):
+    for length in (b'-5', b'abc'):
+        request = (b'POST /recognize HTTP/1.1\r\nContent-Length: ' + length +
+                   b'\r\n\r\n')
+        assert rawStatus(server, request) == 400
+
+
+def test_undecodable_body(server):
+    for body in (b'', b'not an image'):
+        connection = http.client.HTTPConnection('127.0.0.1', server, timeout=10)
+        connection.request('POST', '/recognize', body)
+        response = connection.getresponse()
+        assert response.status == 400
+        assert json.loads(response.read())['error'] == '无法解码图像'
+        connection.close()
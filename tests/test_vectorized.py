@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+# 向量化实现与原来逐个循环的实现对比
+# 人脸框的抑制和微表情的计算改为 NumPy 批量计算后，结果必须与原来的循环完全一致
+
+import numpy as np
+
+from data import EMOTION_LABELS, EMOTION_MAP, EMOTION_MICRO_LABELS
+from visualmodule import Recognizer
+
+
+# 原来 getFace 中去除眼睛、脖子等干扰数据的两重循环
+def suppressLoop(face: np.ndarray) -> list[tuple]:
+    result = []
+    for x1, y1, size1 in face:
+        for x2, y2, size2 in face:
+            if size1 == size2:
+                continue
+
+            # 检查是否有重叠
+            if (x1 < x2 + size2 and x2 < x1 + size1 and y1 < y2 + size2
+                    and y2 < y1 + size1 and size1 * 2 < size2):
+                break
+        else:
+            result.append((x1, y1, size1))
+    return result
+
+
+# 原来逐张人脸计算的微表情
+def microLoop(origin) -> str:
+    result = []
+    confidence = 0
+    emotions = tuple(round(EMOTION_MAP[i](origin[i])) for i in range(7))
+    limit = np.floor(0.85 * max(emotions))
+    emotions = sorted(enumerate(emotions), key=lambda x: x[1],
+                      reverse=True)[:3]
+    for i, value in emotions:
+        if value < limit:
+            break
+        result.append(i)
+        confidence += origin[i]
+    name = tuple(sorted(result))
+    detail = tuple(EMOTION_LABELS[i] for i in result)
+    return EMOTION_MICRO_LABELS[name].format(*detail, round(confidence * 100))
+
+
+def test_suppress_matches_loop():
+    rng = np.random.default_rng(0)
+    for _ in range(2000):
+        count = int(rng.integers(1, 12))
+        face = np.stack([
+            rng.integers(0, 400, count),
+            rng.integers(0, 400, count),
+            rng.integers(10, 200, count)
+        ], 1)
+        kept = face[Recognizer.suppressFace(face)]
+        assert [tuple(f) for f in kept.tolist()] == [
+            tuple(int(v) for v in f) for f in suppressLoop(face)
+        ]
+
+
+def test_microexpressions_match_loop():
+    rng = np.random.default_rng(0)
+    origin = rng.dirichlet(np.full(7, 0.5), 5000).astype(np.float32)
+    # 加入概率相同和集中在一种表情的情况，检查并列时的顺序
+    origin = np.concatenate(
+        [origin, np.full((1, 7), 1 / 7, np.float32),
+         np.eye(7, dtype=np.float32)])
+    combos, confidences = Recognizer.microexpressions(origin)
+    for row, combo, confidence in zip(origin, combos, confidences):
+        assert Recognizer.microLabel(combo, confidence) == microLoop(row)
@@ -42,14 +42,14 @@ class Ui_Form(object):
         self.lData.setObjectName("lData")
         self.bStart = QtWidgets.QPushButton(Form)
         self.bStart.setEnabled(False)
-        self.bStart.setGeometry(QtCore.QRect(50, 270, 111, 41))
+        self.bStart.setGeometry(QtCore.QRect(50, 300, 111, 41))
         font = QtGui.QFont()
         font.setFamily("微软雅黑")
         font.setPointSize(14)
         self.bStart.setFont(font)
         self.bStart.setObjectName("bStart")
         self.fType = QtWidgets.QFrame(Form)
-        self.fType.setGeometry(QtCore.QRect(40, 120, 131, 91))
+        self.fType.setGeometry(QtCore.QRect(40, 120, 131, 121))
         self.fType.setFrameShape(QtWidgets.QFrame.Shape.StyledPanel)
         self.fType.setFrameShadow(QtWidgets.QFrame.Shadow.Raised)
         self.fType.setObjectName("fType")
@@ -82,6 +82,15 @@ class Ui_Form(object):
         self.rCamera.setCursor(
             QtGui.QCursor(QtCore.Qt.CursorShape.PointingHandCursor))
         self.rCamera.setObjectName("rCamera")
+        self.rMulti = QtWidgets.QRadioButton(self.fType)
+        self.rMulti.setGeometry(QtCore.QRect(0, 90, 121, 31))
+        font = QtGui.QFont()
+        font.setFamily("微软雅黑")
+        font.setPointSize(14)
+        self.rMulti.setFont(font)
+        self.rMulti.setCursor(
+            QtGui.QCursor(QtCore.Qt.CursorShape.PointingHandCursor))
+        self.rMulti.setObjectName("rMulti")
         self.lTitle = QtWidgets.QLabel(Form)
         self.lTitle.setGeometry(QtCore.QRect(210, 20, 311, 41))
         font = QtGui.QFont()
@@ -91,7 +100,7 @@ class Ui_Form(object):
         self.lTitle.setAlignment(QtCore.Qt.AlignmentFlag.AlignCenter)
         self.lTitle.setObjectName("lTitle")
         self.bPrepare = QtWidgets.QPushButton(Form)
-        self.bPrepare.setGeometry(QtCore.QRect(50, 220, 111, 41))
+        self.bPrepare.setGeometry(QtCore.QRect(50, 250, 111, 41))
         font = QtGui.QFont()
         font.setFamily("微软雅黑")
         font.setPointSize(14)
@@ -114,6 +123,7 @@ class Ui_Form(object):
         self.rImage.setText(_translate("Form", "图像识别"))
         self.rVidio.setText(_translate("Form", "视频识别"))
         self.rCamera.setText(_translate("Form", "实时识别"))
+        self.rMulti.setText(_translate("Form", "多路识别"))
         self.lTitle.setText(_translate("Form", "人脸表情识别系统"))
         self.bPrepare.setText(_translate("Form", "模型载入"))
 
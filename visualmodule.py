@@ -8,97 +8,368 @@
 # Template
 # 识别器的模板，用于提供识别器切换流程和通用视觉模块
 #
+# createDetector
+# 创建一组独立的局部对比度增强器和人脸检测器，供各个后台线程分别使用
+#
+# cancelRead
+# 后台线程停止时通知识别器，阻塞在 readFrame 中的采集线程尽快返回
+#
 # getFace
-# 从灰度图像中检测人脸
+# 从灰度图像中检测人脸，检测在缩小后的图像上进行，返回原图坐标
+# 各环节的耗时均通过 Stats 记录，关闭统计时没有额外开销
+#
+# detectScale
+# 计算人脸检测时图像的缩放比例
+#
+# detectTiled
+# 将大图切分为相互重叠的图块，在线程池中并行检测人脸，并合并重复的人脸框
+#
+# initTile
+# 分块检测线程池的初始化函数，每个线程创建各自的人脸检测器
+#
+# suppressFace
+# 人脸框的非极大值抑制，去除干扰数据和重复的人脸框
 #
 # getEmotion
 # 为图像中每个面部区域检测表情
 #
+# cropFace
+# 从灰度图像中裁剪出面部区域，并缩放到表情识别器的输入尺寸
+#
+# predictEmotion
+# 识别一组面部区域的表情，面部区域可以来自不同的图像
+#
+# trackFace
+# 用光流法跟踪上一帧的人脸框，两次人脸检测之间不再沿用旧的位置
+#
+# thumbnail
+# 将灰度图像缩小为用于比较画面变化的缩略图
+#
+# frameChange
+# 计算两张缩略图的平均灰度差
+#
 # markEmotion
 # 在图像上标记表情信息，同时整理成文本信息
 #
+# saveImg
+# 将当前展示的图像导出到磁盘，仅在用户主动导出时调用
+#
 # microexpression
 # 根据给定的情感原始值元组，计算并返回最显著的微表情及其置信度
 #
+# microexpressions
+# 一次计算多张人脸的微表情组合下标和置信度，不生成文本
+#
+# microLabel
+# 将表情组合和置信度整理为微表情文本，仅在需要展示时调用
+#
 # putText_CN
 # 在图片上添加中文
-# cv库无法执行此工作，需要将图片转为PIL文件，添加完成后再转回去
+# cv库无法执行此工作，因此用PIL渲染文字的透明度图块，再混合到图片的对应位置
+#
+# renderText
+# 渲染文字的透明度图块，标签的种类有限，渲染结果放入LRU缓存重复使用
 #
 # uint2float
 # 将图片从uint_8矩阵转化为float32矩阵，便于识别器处理
 #
-# 最后更新时间 2024/05/16
+# VideoReader
+# 顺序读取视频，跳过的帧只用 grab 解码而不取出，可选后台线程预读
+#
+# 最后更新时间 2026/10/18
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from math import floor
+import os
+from queue import Queue
+import threading
 from PIL import Image as PILImage, ImageDraw
 import cv2
 from cv2.typing import MatLike as CVImage
-from cv2 import COLOR_BGR2RGB, COLOR_RGB2BGR
 import numpy as np
 from numpy._typing import NDArray as NPImage
 
-from data import Result, CLAHE_FACE, CLASSIFIER_FACE, CLASSIFIER_EMOTION, CLASSIFIER_EMOTION_SIZE, EMOTION_LABELS, EMOTION_MICRO_LABELS, EMOTION_MAP, FONT
+from data import Result, Models, MODEL_FACE, CLAHE_FACE, FACE_SCALE_FACTOR, FACE_MIN_NEIGHBORS, FACE_MIN_SIZE, FACE_MAX_SIZE, FACE_DETECT_SCALE, FACE_DETECT_MARGIN, FACE_MIN_FACE, FACE_TILE_SIZE, FACE_TILE_OVERLAP, FACE_TILE_THREADS, FACE_TILE_COVER, FACE_TILE_IOU, FACE_SUPPRESS_RATIO, FACE_SUPPRESS_OVERLAP, FACE_SUPPRESS_IOU, EMOTION_BATCH_SIZE, EMOTION_LABELS, EMOTION_MICRO_LABELS, EMOTION_MAP, GLYPH_CACHE_SIZE, TEXT_COLOR, VIDIO_STRIDE, VIDIO_READAHEAD, TRACK_POINTS, TRACK_ERROR, CHANGE_SIZE
 from framework import AbstractRecognizer
+from stats import Stats
 
 
 # 识别器的模板，用于提供识别器切换流程和通用视觉模块
 class Recognizer(AbstractRecognizer):
+    frame: CVImage  # 当前需要展示的图像，由控制层直接交给界面显示
+    stream = False  # 是否为连续画面，连续画面交给后台线程处理
+    drop_frames = False  # 处理不及时的时候是否丢弃旧的画面
+    tile_pool: ThreadPoolExecutor | None = None  # 分块检测使用的线程池
+    tile_lock = threading.Lock()
+    tile_local = threading.local()  # 分块检测线程各自的人脸检测器
 
     def __init__(self, rec: 'Recognizer') -> None:
         if (rec != None):
             rec.radioOff()
             self.radioOn()
 
+    # 创建一组独立的局部对比度增强器和人脸检测器，参数与共用的实例相同
+    # CLAHE 和 CascadeClassifier 都不是线程安全的，同时检测人脸的每个线程需要各自的一组
+    @classmethod
+    def createDetector(cls) -> tuple[cv2.CLAHE, cv2.CascadeClassifier]:
+        clahe = cv2.createCLAHE(clipLimit=CLAHE_FACE.getClipLimit(),
+                                tileGridSize=CLAHE_FACE.getTilesGridSize())
+        return clahe, cv2.CascadeClassifier(MODEL_FACE)
+
+    # 后台线程停止时以 True 调用，启动时以 False 调用
+    # readFrame 会等待新画面的识别器需要据此退出等待，否则后台线程无法结束
+    @classmethod
+    def cancelRead(cls, cancel: bool = True) -> None:
+        pass
+
     # 从灰度图像中检测人脸
+    # 检测在缩小后的图像上进行，返回的人脸框为原图坐标
+    # 在后台线程中检测时需传入该线程自己的 clahe 和 cascade，默认使用 Models 中共用的实例
     @classmethod
-    def getFace(cls, image: CVImage) -> list[tuple]:
+    def getFace(cls,
+                image: CVImage,
+                clahe: cv2.CLAHE | None = None,
+                cascade: cv2.CascadeClassifier | None = None) -> list[tuple]:
+        if clahe is None:
+            clahe = CLAHE_FACE
+        if cascade is None:
+            cascade = Models.face
+        begin = Stats.clock()
+        scale = cls.detectScale(image, cascade)
+        if scale < 1:
+            image = cv2.resize(image,
+                               None,
+                               fx=scale,
+                               fy=scale,
+                               interpolation=cv2.INTER_AREA)
+        begin = Stats.record('resize', begin)
         # image = cv2.GaussianBlur(image, (5, 5), 0)  # 高斯模糊
         # image = cv2.equalizeHist(image)  # 直方图均衡化
-        image = CLAHE_FACE.apply(image)  # 局部对比度增强
-        face = CLASSIFIER_FACE.detectMultiScale(image, 1.3, 5)
+        image = clahe.apply(image)  # 局部对比度增强
+        begin = Stats.record('clahe', begin)
+        minSize = tuple(round(i * scale) for i in FACE_MIN_SIZE)
+        maxSize = tuple(round(i * scale) for i in FACE_MAX_SIZE)
+        if 0 < FACE_TILE_SIZE < max(image.shape[:2]):  # 大图分块并行检测
+            face = cls.detectTiled(image, minSize, maxSize)
+        else:
+            face = cascade.detectMultiScale(
+                image,
+                scaleFactor=FACE_SCALE_FACTOR,
+                minNeighbors=FACE_MIN_NEIGHBORS,
+                minSize=minSize,
+                maxSize=maxSize)
+        begin = Stats.record('cascade', begin)
+        if len(face) == 0:
+            return []
 
         # 移除眼睛、脖子等干扰数据
-        result = []
-        for x1, y1, size1, _ in face:
-            for x2, y2, size2, _ in face:
-                if size1 == size2:
-                    continue
-
-                # 检查是否有重叠
-                if (x1 < x2 + size2 and x2 < x1 + size1 and y1 < y2 + size2
-                        and y2 < y1 + size1 and size1 * 2 < size2):
-                    break
-            else:
-                result.append((x1, y1, size1))
-        return result
+        face = np.asarray(face)[:, :3]
+        face = face[cls.suppressFace(face)]
+
+        # 映射回原图坐标
+        if scale < 1:
+            face = np.round(face / scale).astype(int)
+        Stats.record('suppress', begin)
+        return [tuple(f) for f in face.tolist()]
+
+    # 将大图切分为相互重叠的图块，在线程池中并行检测人脸
+    # OpenCV 检测时会释放 GIL，多个图块可以同时利用多个核心
+    # 检测器不是线程安全的，线程池中每个线程使用 initTile 创建的检测器
+    # 重叠区域内同一张人脸可能被两个图块检测到，合并时只保留完整的一个
+    @classmethod
+    def detectTiled(cls, image: CVImage, minSize: tuple,
+                    maxSize: tuple) -> np.ndarray:
+        height, width = image.shape[:2]
+        step = max(FACE_TILE_SIZE - FACE_TILE_OVERLAP, 1)
+
+        # 图块的起点，最后一块与图像边缘对齐
+        def starts(length: int) -> list[int]:
+            result = list(range(0, max(length - FACE_TILE_SIZE, 0) + 1, step))
+            if result[-1] + FACE_TILE_SIZE < length:
+                result.append(length - FACE_TILE_SIZE)
+            return result
+
+        def detect(origin: tuple[int, int]) -> np.ndarray:
+            x, y = origin
+            tile = image[y:y + FACE_TILE_SIZE, x:x + FACE_TILE_SIZE]
+            face = cls.tile_local.cascade.detectMultiScale(
+                tile,
+                scaleFactor=FACE_SCALE_FACTOR,
+                minNeighbors=FACE_MIN_NEIGHBORS,
+                minSize=minSize,
+                maxSize=maxSize)
+            if len(face) == 0:
+                return np.zeros((0, 3), int)
+            return np.asarray(face)[:, :3] + (x, y, 0)
+
+        with cls.tile_lock:
+            if cls.tile_pool is None:
+                cls.tile_pool = ThreadPoolExecutor(FACE_TILE_THREADS,
+                                                   initializer=cls.initTile)
+        origins = [(x, y) for y in starts(height) for x in starts(width)]
+        face = np.concatenate(list(cls.tile_pool.map(detect, origins)))
+
+        # 合并图块边界处重复的人脸框
+        return face[cls.suppressFace(face,
+                                     ratio=1.0,
+                                     overlap=FACE_TILE_COVER,
+                                     iou=FACE_TILE_IOU)]
+
+    # 分块检测线程池的初始化函数，为每个线程创建各自的人脸检测器
+    @classmethod
+    def initTile(cls) -> None:
+        cls.tile_local.cascade = cv2.CascadeClassifier(MODEL_FACE)
+
+    # 计算人脸检测时图像的缩放比例
+    # 自动模式下，让最小的人脸缩小后仍为级联分类器检测窗口的 FACE_DETECT_MARGIN 倍
+    @classmethod
+    def detectScale(cls,
+                    image: CVImage,
+                    cascade: cv2.CascadeClassifier | None = None) -> float:
+        if FACE_DETECT_SCALE != 'auto':
+            return min(float(FACE_DETECT_SCALE), 1.0)
+        window = min((Models.face if cascade is None else cascade
+                      ).getOriginalWindowSize())
+        return min(window * FACE_DETECT_MARGIN / FACE_MIN_FACE, 1.0)
+
+    # 人脸框的非极大值抑制，返回需要保留的人脸框的掩码
+    # 小框与大得多的框重叠时视为眼睛、脖子等干扰数据而被去除
+    # 交并比过高的重复框只保留较大的一个
+    @classmethod
+    def suppressFace(cls,
+                     face: np.ndarray,
+                     ratio: float = FACE_SUPPRESS_RATIO,
+                     overlap: float = FACE_SUPPRESS_OVERLAP,
+                     iou: float = FACE_SUPPRESS_IOU) -> np.ndarray:
+        x, y, size = (face[:, i].astype(np.float64) for i in range(3))
+
+        # 两两计算重叠面积，行为被检查的框，列为其他框
+        width = (np.minimum(x[:, None] + size[:, None], x + size) -
+                 np.maximum(x[:, None], x))
+        height = (np.minimum(y[:, None] + size[:, None], y + size) -
+                  np.maximum(y[:, None], y))
+        inter = np.clip(width, 0, None) * np.clip(height, 0, None)
+        area = size**2
+
+        # 被更大的框覆盖的比例超过阈值
+        cover = inter / area[:, None]
+        smaller = size[:, None] * ratio < size
+        suppress = (smaller & (cover > overlap)).any(1)
+
+        # 重复的框，大小相同时保留靠前的一个
+        union = area[:, None] + area - inter
+        order = np.arange(len(face))
+        larger = (size > size[:, None]) | ((size == size[:, None]) &
+                                          (order < order[:, None]))
+        suppress |= ((inter / union > iou) & larger).any(1)
+        return ~suppress
 
     # 为图像中每个面部区域检测表情
+    # 所有有效的面部区域会被堆叠为一个批次，一次前向传播完成识别
     @classmethod
-    def getEmotion(cls, image: CVImage, fases) -> list[tuple]:
-        img_np = np.expand_dims(image, 2)  # 224*224*1
-        result = []
+    def getEmotion(cls,
+                   image: CVImage,
+                   fases,
+                   batch_size: int = EMOTION_BATCH_SIZE) -> list[tuple]:
+        boxes, crops = cls.cropFace(image, fases)
+        emotions = cls.predictEmotion(crops, batch_size)
+        return [(*box, emotion) for box, emotion in zip(boxes, emotions)]
+
+    # 从灰度图像中裁剪出面部区域，并缩放到表情识别器的输入尺寸
+    @classmethod
+    def cropFace(cls, image: CVImage, fases) -> tuple[list[tuple], list]:
+        begin = Stats.clock()
+        boxes, crops = [], []
         for x1, y1, size in fases:
             x2, y2 = x1 + size, y1 + size
-            face = img_np[y1:y2, x1:x2]
+            face = image[y1:y2, x1:x2]
             try:
-                face = cv2.resize(face, CLASSIFIER_EMOTION_SIZE)
+                face = cv2.resize(face, Models.emotion_size)
             except:
                 continue
-            face = cls.uint2float(face)
-            face = np.expand_dims(face, 0)
-            face = np.expand_dims(face, -1)
-            emotion = CLASSIFIER_EMOTION.predict(face)[0]  # type: ignore
-            # print(emotion)
-            # label = np.max(emotion)
-            # label = np.argmax(emotion)
-            # confidence = int(emotion[label] * 100)  # 百分数
-            result.append((x1, y1, x2, y2, emotion))
+            boxes.append((x1, y1, x2, y2))
+            crops.append(face)
+        Stats.record('crop', begin)
+        return boxes, crops
+
+    # 识别一组面部区域的表情，面部区域可以来自不同的图像
+    @classmethod
+    def predictEmotion(cls,
+                       crops: list,
+                       batch_size: int = EMOTION_BATCH_SIZE) -> np.ndarray:
+        if len(crops) == 0:
+            return np.zeros((0, len(EMOTION_LABELS)), np.float32)
+
+        # 堆叠为 N*48*48*1 的张量，超过最大批量时分段送入识别器
+        begin = Stats.clock()
+        faces = cls.uint2float(np.stack(crops))[..., np.newaxis]
+        result = np.concatenate([
+            Models.emotion.predict(faces[i:i + batch_size])
+            for i in range(0, len(faces), batch_size)
+        ])
+        Stats.record('predict', begin)
         return result
 
+    # 用光流法跟踪上一帧的人脸框，两次人脸检测之间不再沿用旧的位置
+    # 返回移动后的结果和跟踪置信度，置信度为前后向误差合格的特征点比例
+    @classmethod
+    def trackFace(cls, prev: CVImage, image: CVImage,
+                  emotions: list[tuple]) -> tuple[list[tuple], float]:
+        # 在每个人脸框内选取角点，合并后一次性计算光流
+        points, owners = [], []
+        for i, (x1, y1, x2, y2, _) in enumerate(emotions):
+            corner = cv2.goodFeaturesToTrack(prev[y1:y2, x1:x2], TRACK_POINTS,
+                                             0.01, 3)
+            if corner is None or len(corner) < 3:  # 特征太少，无法跟踪
+                return emotions, 0.0
+            points.append(corner.reshape(-1, 2) + (x1, y1))
+            owners.append(np.full(len(corner), i))
+        if len(points) == 0:
+            return emotions, 0.0
+        points = np.concatenate(points).astype(np.float32)
+        owners = np.concatenate(owners)
+
+        # 前向跟踪后再反向跟踪，误差过大的点视为跟丢
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(prev, image, points, None)
+        back, status_back, _ = cv2.calcOpticalFlowPyrLK(
+            image, prev, moved, None)
+        error = np.linalg.norm(points - back, axis=1)
+        good = ((status.ravel() == 1) & (status_back.ravel() == 1)
+                & (error < TRACK_ERROR))
+
+        # 每个人脸框按特征点位移的中位数平移
+        result, confidence = [], 1.0
+        height, width = image.shape[:2]
+        for i, (x1, y1, x2, y2, emotion) in enumerate(emotions):
+            mask = owners == i
+            confidence = min(confidence, good[mask].mean())
+            if good[mask].sum() == 0:
+                return emotions, 0.0
+            dx, dy = np.median(moved[mask & good] - points[mask & good], 0)
+            dx = int(np.clip(round(dx), -x1, width - x2))
+            dy = int(np.clip(round(dy), -y1, height - y2))
+            result.append((x1 + dx, y1 + dy, x2 + dx, y2 + dy, emotion))
+        return result, float(confidence)
+
+    # 将灰度图像缩小为用于比较画面变化的缩略图
+    @classmethod
+    def thumbnail(cls, image: CVImage) -> CVImage:
+        return cv2.resize(image, CHANGE_SIZE, interpolation=cv2.INTER_AREA)
+
+    # 两张缩略图的平均灰度差，没有可比较的缩略图时视为变化无穷大
+    @classmethod
+    def frameChange(cls, prev: CVImage | None, image: CVImage) -> float:
+        if prev is None:
+            return float('inf')
+        return cv2.norm(prev, image, cv2.NORM_L1) / image.size
+
     # 在图像上标记表情信息，同时整理成文本信息
+    # 所有人脸直接在传入的图像上一次标记完成
     @classmethod
     def markEmotion(cls, image: CVImage,
                     emotions: list[tuple]) -> tuple[CVImage, str]:
+        begin = Stats.clock()
         result = image
         if len(emotions) == 1:
             text = Result.FACE_FOUND_SINGLE.value
@@ -106,59 +377,110 @@ class Recognizer(AbstractRecognizer):
             emotions.sort(key=lambda x: x[0])
             text = Result.FACE_FOUND_MULTIPLE.value.format(len(emotions))
         try:
-            for x1, y1, x2, y2, emotion in emotions:
+            combos, confidences = cls.microexpressions(
+                np.array([emotion for *_, emotion in emotions]))
+            for (x1, y1, x2, y2, _), combo, confidence in zip(
+                    emotions, combos, confidences):
                 # label = f'{EMOTION_LABELS[index]} ({str(data)}%)   '
                 # label = ','.join(f'{emotion[i]}' for i in range(7))
-                label = cls.microexpression(emotion)
-                cv2.rectangle(result, (x1, y1), (x2, y2), (0, 0, 255), 1)
-                result = cls.putText_CN(result, label[:2], (x1, y1))
+                label = cls.microLabel(combo, confidence)
+                cv2.rectangle(result, (x1, y1), (x2, y2), TEXT_COLOR, 1)
+                cls.putText_CN(result, label[:2], (x1, y1))
                 text += label + '\n'
                 print(label)
         except:
             print('发生未知错误，可能是中文字库调用失败')
+        Stats.record('annotate', begin)
         return result, text
 
+    # 将当前展示的图像导出到磁盘，仅在用户主动导出时调用
+    @classmethod
+    def saveImg(cls, path: str) -> bool:
+        begin = Stats.clock()
+        ext = os.path.splitext(path)[1] or '.png'
+        ret, buffer = cv2.imencode(ext, cls.frame)
+        if ret is False:
+            return False
+        buffer.tofile(path)  # 支持中文路径
+        Stats.record('save', begin)
+        return True
+
     # 根据给定的情感原始值元组，计算并返回最显著的微表情及其置信度
     @classmethod
     def microexpression(cls, origin: tuple[int]) -> str:
-        result = []
-        confidence = 0
-        emotions = tuple(EMOTION_MAP[i](origin[i]) for i in range(7))
-        # print(origin)
-        # print(emotions)
-        limit = floor(0.85 * max(emotions))
-        emotions = sorted(enumerate(emotions),
-                          key=lambda x: x[1],
-                          reverse=True)[:3]
-        for i, value in emotions:
-            if value < limit:
-                break
-            result.append(i)
-            confidence += origin[i]
-
-        # return tuple(EMOTION_MAP[i](origin[i]) for i in range(7))
-        # return str(EMOTION_LABELS[result[-1]]) + f'{origin[result[-1]]*100:.0}'
+        combos, confidences = cls.microexpressions(np.asarray(origin)[None])
+        return cls.microLabel(combos[0], confidences[0])
+
+    # 一次计算多张人脸的微表情，origin 为 N*7 的表情概率
+    # 返回 N*3 的表情组合下标（按显著程度排列，不足三个用 -1 补齐）和 N 个置信度
+    @classmethod
+    def microexpressions(cls,
+                         origin: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        count = len(origin)
+        if count == 0:
+            return np.zeros((0, 3), np.intp), np.zeros(0, np.float32)
+        emotions = np.stack(
+            [np.round(EMOTION_MAP[i](origin[:, i])) for i in range(7)],
+            1).astype(np.float64)
+        limit = np.floor(0.85 * emotions.max(1, keepdims=True))
+        # 稳定排序，数值相同时下标小的在前，与 sorted 的结果一致
+        order = np.argsort(-emotions, 1, kind='stable')[:, :3]
+        chosen = np.take_along_axis(emotions, order, 1) >= limit
+        chosen = np.logical_and.accumulate(chosen, 1)  # 遇到第一个不满足的即停止
+        combos = np.where(chosen, order, -1)
+        # 按显著程度依次累加原始概率
+        values = np.take_along_axis(origin, order, 1)
+        confidences = values[:, 0].copy()
+        for k in (1, 2):
+            confidences = np.where(chosen[:, k], confidences + values[:, k],
+                                   confidences)
+        return combos, confidences
+
+    # 将一张人脸的表情组合和置信度整理为微表情文本，仅在需要展示时调用
+    @classmethod
+    def microLabel(cls, combo: np.ndarray, confidence: float) -> str:
+        result = [int(i) for i in combo if i >= 0]
         name = tuple(sorted(result))
         detail = tuple(EMOTION_LABELS[i] for i in result)
         return EMOTION_MICRO_LABELS[name].format(*detail,
                                                  round(confidence * 100))
 
     # 在图像上添加中文文本
+    # 直接在原图对应位置按透明度混合缓存的文字图块，不再转换整幅图像
     @classmethod
     def putText_CN(cls, image: CVImage, text: str,
-                   position: tuple[float, float]) -> CVImage:
-        # 将OpenCV图像转换为PIL图像
-        img_pil = PILImage.fromarray(cv2.cvtColor(image, COLOR_BGR2RGB))
+                   position: tuple[int, int]) -> CVImage:
+        alpha, (left, top) = cls.renderText(text)
+        x, y = int(position[0]) + left, int(position[1]) + top
+        height, width = image.shape[:2]
 
-        # 在PIL图像上绘制文本
-        img_draw = ImageDraw.Draw(img_pil)
-        img_draw.text(position, text, font=FONT,
-                      fill=(255, 0, 0))  # PIL中颜色为RGB格式
+        # 裁剪到图像范围之内
+        x1, y1 = max(x, 0), max(y, 0)
+        x2 = min(x + alpha.shape[1], width)
+        y2 = min(y + alpha.shape[0], height)
+        if x1 >= x2 or y1 >= y2:
+            return image
+        alpha = alpha[y1 - y:y2 - y, x1 - x:x2 - x, np.newaxis]
 
-        # 将PIL图像转换回OpenCV图像
-        img_res = cv2.cvtColor(np.array(img_pil), COLOR_RGB2BGR)
+        # 按透明度混合文字颜色，OpenCV中颜色为BGR格式
+        roi = image[y1:y2, x1:x2].astype(np.uint16)
+        color = np.array(TEXT_COLOR, np.uint16)
+        roi = (roi * (255 - alpha) + color * alpha + 127) // 255
+        image[y1:y2, x1:x2] = roi.astype(np.uint8)
+        return image
 
-        return img_res
+    # 渲染文字的透明度图块，返回图块和相对于文字位置的偏移
+    # 标签的种类有限，渲染结果放入LRU缓存重复使用
+    @classmethod
+    @lru_cache(maxsize=GLYPH_CACHE_SIZE)
+    def renderText(cls, text: str) -> tuple[np.ndarray, tuple[int, int]]:
+        left, top, right, bottom = Models.font.getbbox(text)
+        mask = PILImage.new('L', (max(right - left, 1), max(bottom - top, 1)))
+        ImageDraw.Draw(mask).text((-left, -top), text, font=Models.font,
+                                  fill=255)
+        alpha = np.array(mask, np.uint16)
+        alpha.flags.writeable = False  # 缓存的图块不允许被修改
+        return alpha, (left, top)
 
     # 将图片从uint_8矩阵转化为float32矩阵，便于识别器处理
     @classmethod
@@ -168,3 +490,67 @@ class Recognizer(AbstractRecognizer):
         x = x - 0.5
         x = x * 2.0
         return x
+
+
+# 顺序读取视频，跳过的帧只用 grab 解码而不取出，可选后台线程预读
+# 不再逐帧 set(CAP_PROP_POS_FRAMES)，避免每次都回到关键帧重新解码
+class VideoReader():
+
+    def __init__(self,
+                 capture: cv2.VideoCapture,
+                 stride: int = VIDIO_STRIDE,
+                 readahead: int = VIDIO_READAHEAD) -> None:
+        self.capture = capture
+        self.stride = max(1, stride)
+        self.index = -1  # 解码器当前所在的帧序号
+        self.position = -1  # 最近一次返回的帧序号
+        self.stopped = False
+        self.thread = None
+        if readahead > 0:
+            self.queue = Queue(readahead)
+            self.thread = threading.Thread(target=self.decodeLoop,
+                                           daemon=True)
+            self.thread.start()
+
+    # 读取下一帧，首帧之后每次跳过 stride - 1 帧
+    def readNext(self) -> tuple[bool, CVImage, int]:
+        skip = 0 if self.index < 0 else self.stride - 1
+        for _ in range(skip):
+            if self.capture.grab() is False:
+                return False, None, self.index  # type: ignore
+            self.index += 1
+        ret, frame = self.capture.read()
+        if ret:
+            self.index += 1
+        return ret, frame, self.index
+
+    # 预读线程，提前解码后续的画面
+    def decodeLoop(self) -> None:
+        while not self.stopped:
+            item = self.readNext()
+            self.queue.put(item)
+            if item[0] is False:
+                return
+
+    def read(self) -> tuple[bool, CVImage]:
+        if self.stopped:
+            return False, None  # type: ignore
+        if self.thread is None:
+            ret, frame, index = self.readNext()
+        else:
+            ret, frame, index = self.queue.get()
+        if ret is False:
+            self.stopped = True
+            return ret, frame
+        self.position = index
+        return ret, frame
+
+    # 停止预读线程
+    def release(self) -> None:
+        self.stopped = True
+        if self.thread is None:
+            return
+        while self.thread.is_alive():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.thread.join(0.05)
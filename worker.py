@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+# 基于机器视觉的人脸表情识别系统设计-汪哲文毕业设计
+#
+# worker.py
+# 本文件为控制层，负责在后台线程中运行视频识别器和实时识别器
+# 采集和识别分别在两个线程中进行，识别结果通过信号交还给界面
+#
+# FrameQueue
+# 有界的帧队列，队列满时丢弃最旧的帧或等待消费
+#
+# DetectWorker
+# 识别线程，同时启动一个采集线程，将最新的识别结果通过信号发送给界面
+#
+# ModelLoader
+# 模型载入线程，在后台载入并预热模型，通过信号汇报进度
+#
+# 最后更新时间 2026/10/18
+
+from collections import deque
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from data import Result, Models, FRAME_QUEUE_SIZE
+from stats import Stats
+from visualmodule import Recognizer
+
+
+# 有界的帧队列，队列满时丢弃最旧的帧或等待消费
+class FrameQueue():
+
+    def __init__(self, size: int = FRAME_QUEUE_SIZE, drop: bool = True):
+        self.frames = deque()
+        self.size = size
+        self.drop = drop
+        self.closed = False
+        self.cond = threading.Condition()
+
+    # 放入一帧，返回队列是否仍在工作
+    def put(self, frame) -> bool:
+        with self.cond:
+            while (not self.drop and not self.closed
+                   and len(self.frames) >= self.size):
+                self.cond.wait()
+            if self.closed:
+                return False
+            if len(self.frames) >= self.size:
+                self.frames.popleft()  # 丢弃最旧的帧
+            self.frames.append(frame)
+            self.cond.notify_all()
+            return True
+
+    # 取出最旧的一帧，队列关闭时返回 None
+    def get(self):
+        with self.cond:
+            while not self.closed and len(self.frames) == 0:
+                self.cond.wait()
+            if self.closed:
+                return None
+            frame = self.frames.popleft()
+            self.cond.notify_all()
+            return frame
+
+    def close(self) -> None:
+        with self.cond:
+            self.closed = True
+            self.frames.clear()
+            self.cond.notify_all()
+
+
+# 识别线程，同时启动一个采集线程，将最新的识别结果通过信号发送给界面
+class DetectWorker(QThread):
+    detected = pyqtSignal()
+    END = object()  # 视频流结束的标志
+
+    def __init__(self, rec: Recognizer) -> None:
+        super().__init__()
+        self.rec = rec
+        self.queue = FrameQueue(drop=rec.drop_frames)
+        self.capture = threading.Thread(target=self.captureLoop, daemon=True)
+        self.lock = threading.Lock()
+        self.result = None
+        self.pending = False
+
+    # 采集线程，持续从识别器读取画面放入队列
+    def captureLoop(self) -> None:
+        while True:
+            begin = Stats.clock()
+            ret, frame = self.rec.readFrame()  # type: ignore
+            Stats.record('capture', begin)
+            if ret is False:
+                self.queue.put(self.END)
+                return
+            if self.queue.put(frame) is False:
+                return
+
+    # 识别线程，从队列中取出画面并识别
+    def run(self) -> None:
+        self.rec.cancelRead(False)
+        self.capture.start()
+        while True:
+            frame = self.queue.get()
+            if frame is None:  # 线程被停止
+                break
+            if frame is self.END:  # 视频流结束
+                self.publish(Result.FINISH, self.rec.frame, '')
+                break
+            res, text = self.rec.processFrame(frame)  # type: ignore
+            self.publish(res, self.rec.frame, text)
+        self.queue.close()
+
+    # 保存最新的识别结果，界面尚未取走上一个结果时不重复发送信号
+    # 这样界面总是显示最新的画面，而不会积压
+    def publish(self, res: Result, frame, text: str) -> None:
+        with self.lock:
+            self.result = res, frame, text
+            if self.pending:
+                return
+            self.pending = True
+        self.detected.emit()
+
+    # 取走最新的识别结果
+    def take(self) -> tuple:
+        with self.lock:
+            self.pending = False
+            return self.result  # type: ignore
+
+    # 停止采集和识别，等待线程退出
+    def stop(self) -> None:
+        self.queue.close()
+        self.rec.cancelRead()
+        self.wait()
+        if self.capture.is_alive():
+            self.capture.join()
+
+
+# 模型载入线程，在后台载入并预热模型，通过信号汇报进度
+class ModelLoader(QThread):
+    progress = pyqtSignal(int, str)
+    failed = pyqtSignal(str)
+
+    def run(self) -> None:
+        try:
+            Models.load(self.progress.emit)
+        except Exception as e:
+            print(f'模型载入失败 {e!r}')
+            self.failed.emit(f'模型载入失败：{e}')